@@ -22,7 +22,10 @@ setup(name='tap-adroll',
           ],
           'test': [
               'simplejson==3.11.1',
-          ]
+          ],
+          'fast-json': [
+              'orjson==3.8.3',
+          ],
       },
       entry_points='''
           [console_scripts]
@@ -15,7 +15,6 @@ def main():
     config = args.config
     if args.dev:
         LOGGER.warning("Executing Tap in Dev mode")
-    client = AdrollClient(args.config_path, config, args.dev)
 
     catalog = args.catalog or Catalog([])
     state = args.state
@@ -24,11 +23,14 @@ def main():
         raise Exception("DEPRECATED: Use of the 'properties' parameter is not supported. Please use --catalog instead")
 
     if args.discover:
+        # Discovery only reads the bundled schemas, so it needs neither
+        # credentials nor the network
         LOGGER.info("Starting discovery mode")
         catalog = do_discover()
         write_catalog(catalog)
     else:
         LOGGER.info("Starting sync mode")
+        client = AdrollClient(args.config_path, config, args.dev)
         do_sync(client, config, state, catalog)
 
 if __name__ == "__main__":
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import singer
+
+LOGGER = singer.get_logger()
+
+# Endpoints returning slowly changing dimension data, and how long their
+# responses may be reused for, in seconds
+DEFAULT_CACHE_TTLS = {
+    'organization/get_advertisables': 3600,
+    'advertisable/get_campaigns': 3600,
+    'advertisable/get_adgroups': 3600,
+    'advertisable/get_segments': 3600,
+}
+DEFAULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
+def cache_key(endpoint, params, account=None):
+    canonical = json.dumps([endpoint, params or {}] + ([account] if account else []), sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class ResponseCache():  # pylint: disable=too-many-instance-attributes
+    """Persistent cache of raw response bodies with per-endpoint TTLs.
+
+    Each body is stored in its own file. The file's mtime is when it was
+    stored and its atime, which is set explicitly on every hit, is when it
+    was last used, so least recently used entries are evicted first once
+    the cache grows beyond `max_bytes`. Only endpoints with a TTL are cached.
+    Keys include the `account`, so configs for different organizations can
+    share a directory.
+    """
+
+    def __init__(self, directory, ttls=None, max_bytes=DEFAULT_CACHE_MAX_BYTES, bypass=False, clock=time.time,
+                 account=None):
+        self.directory = directory
+        self.account = account
+        self.ttls = dict(DEFAULT_CACHE_TTLS if ttls is None else ttls)
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config, bypass=False):
+        ttls = dict(DEFAULT_CACHE_TTLS)
+        overrides = config.get('cache_ttls') or {}
+        if isinstance(overrides, str):
+            overrides = json.loads(overrides)
+        ttls.update({endpoint: float(ttl) for endpoint, ttl in overrides.items()})
+        return cls(config['cache_dir'],
+                   ttls={endpoint: ttl for endpoint, ttl in ttls.items() if ttl},
+                   max_bytes=int(config.get('cache_max_bytes') or DEFAULT_CACHE_MAX_BYTES),
+                   bypass=bypass,
+                   account=config.get('client_id'))
+
+    def applies_to(self, endpoint):
+        return endpoint in self.ttls
+
+    def _path(self, endpoint, params):
+        return os.path.join(self.directory, cache_key(endpoint, params, self.account) + '.json')
+
+    def get(self, endpoint, params):
+        if self.bypass or not self.applies_to(endpoint):
+            return None
+        path = self._path(endpoint, params)
+        now = self.clock()
+        try:
+            stored_at = os.stat(path).st_mtime
+            if now - stored_at > self.ttls[endpoint]:
+                os.remove(path)
+                content = None
+            else:
+                with open(path, 'rb') as file:
+                    content = file.read()
+                os.utime(path, (now, stored_at))
+        except FileNotFoundError:
+            content = None
+
+        with self.lock:
+            if content is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return content
+
+    def put(self, endpoint, params, content):
+        if not self.applies_to(endpoint):
+            return
+        path = self._path(endpoint, params)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as file:
+            file.write(content)
+        now = self.clock()
+        os.utime(tmp_path, (now, now))
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        with self.lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith('.json'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_atime, stat.st_size, name))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def log_summary(self):
+        LOGGER.info("Response cache: %s hits, %s misses", self.hits, self.misses)
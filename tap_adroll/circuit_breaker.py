@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import deque
+
+import singer
+
+from tap_adroll.retry import is_retryable
+
+LOGGER = singer.get_logger()
+
+DEFAULT_FAILURE_RATE = 0.5
+DEFAULT_MIN_REQUESTS = 5
+DEFAULT_WINDOW = 20
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def is_partition_failure(exc):
+    """Whether `exc` means the API could not serve a partition, rather than a bug or bad config."""
+    return isinstance(exc, CircuitOpenError) or is_retryable(exc)
+
+
+class CircuitBreaker():  # pylint: disable=too-many-instance-attributes
+    """Stops calling an endpoint once too many of its recent requests failed.
+
+    Outcomes of the last `window` requests of each endpoint, after retries,
+    are kept. Once at least `min_requests` of them are known and the share
+    that failed reaches `failure_rate`, the circuit opens and every further
+    request to the endpoint raises CircuitOpenError without being sent. It
+    stays open for the rest of the run, or for `reset_seconds` if set, after
+    which the endpoint gets a fresh window. Only failures that retrying
+    could not fix count, not 4xx responses.
+    """
+
+    def __init__(self, failure_rate=DEFAULT_FAILURE_RATE, min_requests=DEFAULT_MIN_REQUESTS,
+                 window=DEFAULT_WINDOW, reset_seconds=None, clock=time.monotonic):
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.window = window
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.outcomes = {}
+        self.opened = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(failure_rate=float(config.get('circuit_failure_rate') or DEFAULT_FAILURE_RATE),
+                   min_requests=int(config.get('circuit_min_requests') or DEFAULT_MIN_REQUESTS),
+                   window=int(config.get('circuit_window') or DEFAULT_WINDOW),
+                   reset_seconds=float(config.get('circuit_reset_seconds') or 0) or None)
+
+    def check(self, endpoint):
+        with self.lock:
+            opened_at = self.opened.get(endpoint)
+            if opened_at is None:
+                return
+            if self.reset_seconds is not None and self.clock() - opened_at >= self.reset_seconds:
+                LOGGER.info("Closing the circuit for endpoint %s after %.0f seconds", endpoint, self.reset_seconds)
+                del self.opened[endpoint]
+                self.outcomes.pop(endpoint, None)
+                return
+        raise CircuitOpenError("Circuit open for endpoint {}: too many recent requests failed, "
+                               "skipping it".format(endpoint))
+
+    def record(self, endpoint, failed):
+        with self.lock:
+            outcomes = self.outcomes.setdefault(endpoint, deque(maxlen=self.window))
+            outcomes.append(failed)
+            failures = sum(outcomes)
+            if (endpoint in self.opened or len(outcomes) < self.min_requests
+                    or failures < self.failure_rate * len(outcomes)):
+                return
+            self.opened[endpoint] = self.clock()
+        LOGGER.error("Opening the circuit for endpoint %s, %s of its last %s requests failed",
+                     endpoint, failures, len(outcomes))
+
+    def open_endpoints(self):
+        with self.lock:
+            return sorted(self.opened)
@@ -1,39 +1,177 @@
+import contextlib
+import functools
+import hashlib
 import json
-import backoff
+import os
+import shutil
+import tempfile
+import threading
+import time
 import requests
 import singer
 
+from oauthlib.oauth2 import OAuth2Error
+from requests.adapters import HTTPAdapter
 from requests_oauthlib import OAuth2Session
 
+from tap_adroll.cache import ResponseCache
+from tap_adroll.cassette import CassettePlayer, CassetteRecorder
+from tap_adroll.circuit_breaker import CircuitBreaker
+from tap_adroll.concurrency import AdaptiveConcurrencyLimiter
+from tap_adroll.deadline import Deadline
+from tap_adroll.decoding import get_decoder
+from tap_adroll.hedging import RequestHedger
+from tap_adroll.http_metrics import HttpMetrics
+from tap_adroll.memo import RequestMemo
+from tap_adroll.rate_limit import RateLimiter, parse_retry_after
+from tap_adroll.registry import AdvertisableRegistry
+from tap_adroll.request_log import RequestLog
+from tap_adroll.retry import RetryPolicy, is_retryable
+from tap_adroll.streaming import iter_json_array
+from tap_adroll.transfer import TransferStats, default_headers, wire_bytes
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 LOGGER = singer.get_logger()
 ENDPOINT_BASE = "https://services.adroll.com/api/v1/"
 TOKEN_REFRESH_URL = 'https://services.adroll.com/auth/token'
+ADVERTISABLES_ENDPOINT = 'organization/get_advertisables'
+
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+DEFAULT_ASYNC_CONCURRENCY = 10
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_REQUEST_TIMEOUT = 300.0
+# Refresh tokens this many seconds before they actually expire
+TOKEN_EXPIRY_MARGIN = 60
+STREAM_CHUNK_SIZE = 64 * 1024
+# Responses declaring a larger Content-Length are parsed as they download
+DEFAULT_STREAM_THRESHOLD = 1024 * 1024
+
+
+def get_config_bool(config, key, default=False):
+    value = config.get(key)
+    if value is None or value == '':
+        return default
+    if isinstance(value, str):
+        return value.lower() in ('true', 't', 'yes', 'y', '1')
+    return bool(value)
+
+
+@contextlib.contextmanager
+def config_file_lock(config_path):
+    # Coordinates token refreshes between tap processes sharing a config file
+    try:
+        handle = open(config_path + '.lock', 'a')
+    except OSError as exc:
+        LOGGER.warning("Unable to lock %s, token refreshes are only coordinated within this process: %s",
+                       config_path, exc)
+        yield
+        return
+
+    with handle:
+        if fcntl:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
+def write_json_atomic(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as file:
+            json.dump(data, file, indent=2)
+            file.flush()
+            os.fsync(file.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _counted(chunks, counter):
+    for chunk in chunks:
+        counter['bytes'] += len(chunk)
+        yield chunk
+
+
+def _collect(chunks, received):
+    for chunk in chunks:
+        received.append(chunk)
+        yield chunk
 
 
 class AdrollAuthenticationError(Exception):
     pass
-class AdrollClient():
+class AdrollClient():  # pylint: disable=too-many-instance-attributes
     def __init__(self, config_path, config, dev_mode = False):
         self.dev_mode = dev_mode
         self.config_path = config_path
         self.config = config
+        # Serializes token refreshes between worker threads sharing this client
+        self._token_lock = threading.Lock()
+        self.token_expires_at = None
+        self.rate_limiter = RateLimiter.from_config(config)
+        self.concurrency = AdaptiveConcurrencyLimiter.from_config(config)
+        self.retry_policy = RetryPolicy.from_config(config)
+        self.circuit_breaker = CircuitBreaker.from_config(config)
+        self.deadline = Deadline.from_config(config)
+        self.hedger = None
+        if get_config_bool(config, 'hedge_requests'):
+            self.hedger = RequestHedger.from_config(config, max_workers=2 * self.concurrency.maximum)
+        self.cassette_recorder = None
+        self.cassette_player = None
+        cassette_mode = config.get('cassette_mode')
+        if cassette_mode == 'record':
+            self.cassette_recorder = CassetteRecorder(config['cassette_path'])
+        elif cassette_mode == 'replay':
+            self.cassette_player = CassettePlayer(config['cassette_path'],
+                                                  float(config.get('cassette_latency_factor') or 0))
+        elif cassette_mode:
+            raise Exception("Unknown cassette_mode {}, expected 'record' or 'replay'".format(cassette_mode))
+        self.response_cache = None
+        if config.get('cache_dir'):
+            self.response_cache = ResponseCache.from_config(config, bypass=get_config_bool(config, 'cache_bypass'))
+        self.connect_timeout = float(config.get('connect_timeout') or DEFAULT_CONNECT_TIMEOUT)
+        self.request_timeout = float(config.get('request_timeout') or DEFAULT_REQUEST_TIMEOUT)
+        self.decode = get_decoder(config.get('json_decoder'))
+        self.stream_threshold = int(config.get('stream_threshold_bytes') or DEFAULT_STREAM_THRESHOLD)
+        self.transfer_stats = TransferStats()
+        self.http_metrics = HttpMetrics.from_config(config)
+        self.request_memo = RequestMemo.from_config(config)
+        self.advertisables = AdvertisableRegistry()
+        self.request_log = RequestLog.from_config(config, verbose=get_config_bool(config, 'debug_logging'))
+
+        self._organization_eid = None
 
         self.authenticate_request()
-        try:
-            # Make an authenticated request after creating the object to any endpoint
-            org = self.get('organization/get').get('results', {}).get('eid')
-            self.organization_eid = org
-        except Exception as e:
-            LOGGER.info("Error initializing AdrollClient during token refresh, please reauthenticate.")
-            raise AdrollAuthenticationError(e)
+
+    @property
+    def organization_eid(self):
+        # Looked up on first use rather than on every start up
+        if self._organization_eid is None:
+            try:
+                self._organization_eid = self.get('organization/get').get('results', {}).get('eid')
+            except Exception as e:
+                LOGGER.info("Error looking up the organization for AdrollClient, please reauthenticate.")
+                raise AdrollAuthenticationError(e)
+        return self._organization_eid
 
     def authenticate_request(self):
         token = {
             'access_token': self.config['access_token'],
             'refresh_token': self.config['refresh_token'],
             'token_type': 'Bearer',
-            # Set expires_in to a negative number to force the client to reauthenticate
-            'expires_in': '-30'
         }
         extra = {
             'client_id': self.config['client_id'],
@@ -53,12 +191,105 @@ class AdrollClient():
             self.session = OAuth2Session(self.config['client_id'],
                                          token=dev_mode_token)
         else :
-
+            # Refreshes are done by _refresh_token rather than by the session
+            # itself, so that only one thread or process refreshes at a time
             self.session = OAuth2Session(self.config['client_id'],
                                          token=token,
-                                         auto_refresh_url=TOKEN_REFRESH_URL,
-                                         auto_refresh_kwargs=extra,
-                                         token_updater=self._write_config)
+                                         auto_refresh_kwargs=extra)
+            # Without a stored expiry we cannot tell whether the token is still
+            # valid, so refresh it before the first request
+            self.token_expires_at = float(self.config.get('expires_at') or 0)
+
+        self._mount_adapters()
+
+    def _token_expired(self):
+        return self.token_expires_at is not None and time.time() >= self.token_expires_at - TOKEN_EXPIRY_MARGIN
+
+    def _ensure_token(self):
+        if not self.dev_mode and self._token_expired():
+            self._refresh_token()
+
+    def _invalidate_token(self, access_token):
+        # The stored expiry can be wrong, e.g. after a token was revoked, so
+        # a 401 marks the token it was sent with as expired. Threads that see
+        # a 401 for a token that has already been replaced do nothing.
+        with self._token_lock:
+            if self.config['access_token'] == access_token:
+                self.token_expires_at = 0
+
+    def _read_config(self):
+        try:
+            with open(self.config_path) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _use_token(self, token, expires_at):
+        if expires_at is None:
+            # Unknown expiry, refreshed again before the next request
+            expires_at = 0
+        else:
+            # The session keeps the expiry of the previous token unless told
+            # the new one, and refuses to send it once that has passed
+            expires_at = float(expires_at)
+            token = {**token, 'expires_at': expires_at, 'expires_in': max(0, int(expires_at - time.time()))}
+        self.session.token = token
+        self.token_expires_at = expires_at
+        self.config['access_token'] = token['access_token']
+        self.config['refresh_token'] = token['refresh_token']
+
+    def _refresh_token(self):
+        with self._token_lock:
+            # Another thread may have refreshed while we waited for the lock
+            if not self._token_expired():
+                return
+            with config_file_lock(self.config_path):
+                # Another process may have refreshed while we waited for the
+                # file lock, in which case our refresh token is already spent
+                on_disk = self._read_config()
+                if on_disk.get('refresh_token') and on_disk.get('access_token') and (
+                        on_disk['refresh_token'] != self.config['refresh_token']
+                        or on_disk['access_token'] != self.config['access_token']):
+                    LOGGER.info("Using credentials refreshed by another process")
+                    self._use_token({'access_token': on_disk['access_token'],
+                                     'refresh_token': on_disk['refresh_token'],
+                                     'token_type': 'Bearer'}, on_disk.get('expires_at'))
+                    return
+
+                try:
+                    token = self.session.refresh_token(TOKEN_REFRESH_URL, timeout=self._timeout())
+                except OAuth2Error as exc:
+                    # The refresh token was revoked or is invalid, retrying cannot help
+                    LOGGER.info("Error refreshing the access token, please reauthenticate.")
+                    raise AdrollAuthenticationError(exc) from exc
+                self._use_token(token, token.get('expires_at'))
+                self._write_config(token)
+
+    def _mount_adapters(self):
+        # One connection pool per host, shared by every thread using this
+        # session, so repeated requests reuse the same TLS connection
+        adapter = HTTPAdapter(
+            pool_connections=int(self.config.get('pool_connections') or DEFAULT_POOL_CONNECTIONS),
+            pool_maxsize=self._pool_maxsize(),
+            pool_block=get_config_bool(self.config, 'pool_block'),
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.session.headers.update(default_headers(self.config,
+                                                    compression=get_config_bool(self.config, 'compression', default=True)))
+
+        if not get_config_bool(self.config, 'keep_alive', default=True):
+            self.session.headers['Connection'] = 'close'
+
+    def _pool_maxsize(self):
+        if self.config.get('pool_maxsize'):
+            return int(self.config['pool_maxsize'])
+        # Requests in flight are capped by the concurrency limiter, but a
+        # streamed response keeps its connection after releasing its slot,
+        # until the async worker reading it is done
+        async_concurrency = int(self.config.get('async_concurrency') or DEFAULT_ASYNC_CONCURRENCY)
+        return max(DEFAULT_POOL_MAXSIZE, self.concurrency.maximum + async_concurrency)
 
     def _write_config(self, token):
         LOGGER.info("Credentials Refreshed")
@@ -68,20 +299,52 @@ class AdrollClient():
 
         config['refresh_token'] = token['refresh_token']
         config['access_token'] = token['access_token']
+        # Lets other processes sharing this config know how long the token lasts
+        if token.get('expires_at'):
+            config['expires_at'] = token['expires_at']
+
+        # Readers never see a partially written file
+        write_json_atomic(self.config_path, config)
+
+    def _cacheable(self, method, endpoint):
+        return method.upper() == 'GET' and self.response_cache and self.response_cache.applies_to(endpoint)
+
+    def _get_cached(self, method, endpoint, params):
+        if not self._cacheable(method, endpoint):
+            return None
+        content = self.response_cache.get(endpoint, params)
+        if content is not None:
+            self.request_log.info("Using cached response for endpoint %s, with params %s", endpoint, params)
+        return content
+
+    def _memoized(self, method, endpoint, headers=None):
+        return method.upper() == 'GET' and headers is None and self.request_memo.applies_to(endpoint)
+
+    def _fetch_content(self, method, endpoint, headers=None, params=None, data=None, override_api=None):
+        content = self._get_cached(method, endpoint, params)
+        if content is not None:
+            return content
 
-        with open(self.config_path, 'w') as file:
-            json.dump(config, file, indent=2)
+        response = self._request(method, endpoint, headers=headers, params=params, data=data,
+                                 override_api=override_api)
+        if self._cacheable(method, endpoint):
+            self.response_cache.put(endpoint, params, response.content)
+        return response.content
 
-    @backoff.on_exception(backoff.constant,
-                          (requests.exceptions.HTTPError),
-                          max_tries=3,
-                          interval=10)
     def _make_request(self, method, endpoint, headers=None, params=None, data=None, override_api=None):
+        fetch = functools.partial(self._fetch_content, method, endpoint, headers=headers, params=params,
+                                  data=data, override_api=override_api)
+        if self._memoized(method, endpoint, headers):
+            return self.decode(self.request_memo.get(endpoint, params, fetch))
+        return self.decode(fetch())
+
+    def _request(self, method, endpoint, headers=None, params=None, data=None, override_api=None, stream=False):
+        self.circuit_breaker.check(endpoint)
         full_url = ENDPOINT_BASE + endpoint
         if override_api:
             full_url = full_url.replace('api', override_api)
 
-        LOGGER.info(
+        self.request_log.info(
             "%s - Making request to %s endpoint %s, with params %s",
             full_url,
             method.upper(),
@@ -89,11 +352,186 @@ class AdrollClient():
             params,
         )
 
-        # TODO: We should merge headers with some default headers like user_agent
-        response = self.session.request(method, full_url, headers=headers, params=params, data=data)
+        send = self._send
+        if method.upper() == 'GET' and self.hedger and self.hedger.applies_to(endpoint):
+            send = functools.partial(self.hedger.call, endpoint, self._send)
+
+        started_at = time.monotonic()
+        failed = True
+        try:
+            response = self._send_with_retries(send, method, endpoint, full_url,
+                                               headers=headers, params=params, data=data, stream=stream)
+            failed = False
+        except Exception as exc:
+            # Only failures retrying could not fix say the endpoint is down
+            if is_retryable(exc):
+                self.circuit_breaker.record(endpoint, failed=True)
+            raise
+        else:
+            self.circuit_breaker.record(endpoint, failed=False)
+            return response
+        finally:
+            self.request_log.record(endpoint, time.monotonic() - started_at, error=failed)
+
+    def _send_with_retries(self, send, method, endpoint, full_url, **kwargs):
+        access_token = self.config.get('access_token')
+        try:
+            return self.retry_policy.call(endpoint, send, method, endpoint, full_url, **kwargs)
+        except requests.exceptions.HTTPError as e:
+            if self.dev_mode or e.response is None or e.response.status_code != 401:
+                raise
+            self._invalidate_token(access_token)
+            return self.retry_policy.call(endpoint, send, method, endpoint, full_url, **kwargs)
+
+    def _timeout(self):
+        # Never wait on a read past the end of the run's deadline
+        read_timeout = self.request_timeout
+        remaining = self.deadline.remaining()
+        if remaining is not None:
+            read_timeout = max(1.0, min(read_timeout, remaining))
+        return (self.connect_timeout, read_timeout)
+
+    def _send(self, method, endpoint, full_url, headers=None, params=None, data=None, stream=False):
+        self.deadline.check_expired()
+        self.rate_limiter.acquire(endpoint)
+        started_at = self.concurrency.acquire()
+        sent_at = None
+        healthy = False
+        response = None
+        try:
+            if self.cassette_player:
+                response = self.cassette_player.replay(method, endpoint, params, full_url)
+            else:
+                # Only checked now, as the waits above can outlast the expiry margin
+                self._ensure_token()
+                sent_at = self.concurrency.clock()
+                response = self.session.request(method, full_url, headers=headers, params=params, data=data,
+                                                timeout=self._timeout(), stream=stream)
+            # Streamed responses are accounted for once their body has been read
+            if not stream or response.status_code >= 400:
+                self._record_response(endpoint, response, time.monotonic() - started_at, len(response.content))
+            if self.cassette_recorder:
+                self.cassette_recorder.record(method, endpoint, params, response, time.monotonic() - started_at)
+            healthy = response.status_code != 429 and response.status_code < 500
+        finally:
+            if response is None:
+                self.http_metrics.record(endpoint, time.monotonic() - started_at)
+            self.concurrency.release(started_at, healthy, endpoint=endpoint, sent_at=sent_at)
+
+        if response.status_code == 429:
+            self.rate_limiter.throttled(endpoint, parse_retry_after(response.headers.get('Retry-After')))
+        else:
+            self.rate_limiter.succeeded(endpoint)
+        if stream and response.status_code >= 400:
+            # Nothing reads the body of a failed streamed response, free its connection
+            response.close()
         response.raise_for_status()
-        # TODO: Check error status, rate limit, etc.
-        return response.json()
+        return response
+
+    def _record_response(self, endpoint, response, latency, decoded_bytes):
+        self.transfer_stats.record(endpoint, wire_bytes(response, decoded_bytes), decoded_bytes)
+        self.http_metrics.record(endpoint, latency, response.status_code, decoded_bytes)
 
     def get(self, url, headers=None, params=None):
         return self._make_request("GET", url, headers=headers, params=params)
+
+    def get_results(self, url, params=None):
+        """Yields the records under `results` of a GET as its body is downloaded.
+
+        Failed requests are retried until the response starts, an error while
+        reading the body is raised after the records read so far were yielded.
+        Memoized endpoints, and uncompressed bodies no larger than
+        `stream_threshold_bytes`, are read whole and decoded with the
+        configured decoder.
+        """
+        if self._memoized('GET', url):
+            fetch = functools.partial(self._fetch_content, 'GET', url, params=params)
+            content = self.request_memo.get(url, params, fetch)
+        else:
+            content = self._get_cached('GET', url, params)
+        if content is not None:
+            yield from self._decoded_results(content)
+            return
+
+        response = self._request('GET', url, params=params, stream=True)
+        body_started_at = time.monotonic()
+        decoded = {'bytes': 0}
+        try:
+            content_length = response.headers.get('Content-Length')
+            # A compressed body's Content-Length says little about its decoded size
+            encoded = response.headers.get('Content-Encoding', 'identity') != 'identity'
+            if content_length is not None and not encoded and int(content_length) <= self.stream_threshold:
+                # Decoding a small body whole is several times cheaper than parsing it incrementally
+                content = response.content
+                decoded['bytes'] = len(content)
+                if self._cacheable('GET', url):
+                    self.response_cache.put(url, params, content)
+                yield from self._decoded_results(content)
+                return
+
+            chunks = _counted(response.iter_content(chunk_size=STREAM_CHUNK_SIZE), decoded)
+            received = None
+            if self._cacheable('GET', url):
+                received = []
+                chunks = _collect(chunks, received)
+            yield from iter_json_array(chunks)
+            # Read whatever follows the results so the connection can be reused
+            for _ in chunks:
+                pass
+            if received is not None:
+                self.response_cache.put(url, params, b''.join(received))
+        finally:
+            latency = response.elapsed.total_seconds() + time.monotonic() - body_started_at
+            self._record_response(url, response, latency, decoded['bytes'])
+            response.close()
+
+    def _decoded_results(self, content):
+        return self.decode(content).get('results') or []
+
+    def get_if_changed(self, url, params=None, validators=None):
+        """GETs `url` unless its response is the same as when `validators` were taken.
+
+        Returns the decoded response and its validators, or None and the
+        validators when the response has not changed, in which case it is
+        not decoded at all.
+        """
+        validators = validators or {}
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+
+        new_validators = {key: validators[key] for key in ('etag', 'last_modified') if validators.get(key)}
+        content = self._get_cached('GET', url, params)
+        if content is None:
+            response = self._request('GET', url, headers=headers or None, params=params)
+            if response.status_code == 304:
+                return None, validators
+            content = response.content
+            if self._cacheable('GET', url):
+                self.response_cache.put(url, params, content)
+            new_validators = {key: response.headers[header]
+                              for key, header in (('etag', 'ETag'), ('last_modified', 'Last-Modified'))
+                              if response.headers.get(header)}
+
+        new_validators['digest'] = hashlib.sha256(content).hexdigest()
+        if new_validators['digest'] == validators.get('digest'):
+            return None, new_validators
+        return self.decode(content), new_validators
+
+    def invalidate_advertisables(self):
+        # Forgets the advertisables and their memoized response, so the next stream asks the API again
+        self.advertisables.invalidate()
+        self.request_memo.invalidate(ADVERTISABLES_ENDPOINT)
+
+    def log_summary(self):
+        self.retry_policy.log_summary()
+        if self.hedger:
+            self.hedger.log_summary()
+        if self.response_cache:
+            self.response_cache.log_summary()
+        self.transfer_stats.log_summary()
+        self.request_memo.log_summary()
+        self.request_log.summarize(force=True)
+        self.http_metrics.log_histograms()
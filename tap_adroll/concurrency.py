@@ -0,0 +1,96 @@
+import threading
+import time
+
+import singer
+from singer import metrics
+
+LOGGER = singer.get_logger()
+
+DEFAULT_MIN_CONCURRENCY = 1
+DEFAULT_INITIAL_CONCURRENCY = 4
+DEFAULT_MAX_CONCURRENCY = 16
+# A request slower than this multiple of the baseline latency counts as a spike
+DEFAULT_LATENCY_TOLERANCE = 3.0
+DECREASE_RATIO = 0.5
+BASELINE_SMOOTHING = 0.1
+
+
+class AdaptiveConcurrencyLimiter():  # pylint: disable=too-many-instance-attributes
+    """Caps the number of in-flight requests with an AIMD window.
+
+    The window grows by one slot per window's worth of healthy responses and
+    is halved on a 429/5xx, a connection error or a latency spike. Requests
+    started before the last decrease cannot trigger another one, so a burst
+    of failures from the same window only halves it once. Spikes are judged
+    against a baseline latency kept per endpoint, as endpoints differ widely.
+    """
+
+    def __init__(self, initial=DEFAULT_INITIAL_CONCURRENCY, minimum=DEFAULT_MIN_CONCURRENCY,
+                 maximum=DEFAULT_MAX_CONCURRENCY, latency_tolerance=DEFAULT_LATENCY_TOLERANCE,
+                 clock=time.monotonic):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.window = float(min(max(initial, minimum), self.maximum))
+        self.latency_tolerance = latency_tolerance
+        self.clock = clock
+        self.in_flight = 0
+        self.baseline_latencies = {}
+        self.last_decrease_at = None
+        self.condition = threading.Condition()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            initial=int(config.get('initial_concurrency') or DEFAULT_INITIAL_CONCURRENCY),
+            minimum=int(config.get('min_concurrency') or DEFAULT_MIN_CONCURRENCY),
+            maximum=int(config.get('max_concurrency') or DEFAULT_MAX_CONCURRENCY),
+            latency_tolerance=float(config.get('latency_tolerance') or DEFAULT_LATENCY_TOLERANCE),
+        )
+
+    @property
+    def limit(self):
+        return max(self.minimum, int(self.window))
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+            return self.clock()
+
+    def release(self, started_at, healthy=True, endpoint=None, sent_at=None):
+        # `sent_at` leaves out what happened between acquiring the slot and
+        # sending the request, like refreshing the token, from the latency
+        now = self.clock()
+        latency = now - (started_at if sent_at is None else sent_at)
+        with self.condition:
+            self.in_flight -= 1
+            previous_limit = self.limit
+
+            baseline_latency = self.baseline_latencies.get(endpoint)
+            spike = (baseline_latency is not None
+                     and latency > baseline_latency * self.latency_tolerance)
+            if not healthy or spike:
+                if self.last_decrease_at is None or started_at >= self.last_decrease_at:
+                    self.window = max(float(self.minimum), self.window * DECREASE_RATIO)
+                    self.last_decrease_at = now
+            else:
+                self.window = min(float(self.maximum), self.window + 1.0 / self.window)
+
+            if healthy:
+                if baseline_latency is None:
+                    self.baseline_latencies[endpoint] = latency
+                else:
+                    self.baseline_latencies[endpoint] = (baseline_latency
+                                                         + BASELINE_SMOOTHING * (latency - baseline_latency))
+
+            limit = self.limit
+            self.condition.notify_all()
+
+        if limit != previous_limit:
+            # Singer has no gauge type, so each change is counted and tagged with the new limit
+            metrics.log(LOGGER, metrics.Point('counter', 'concurrency_window_changes', 1, {
+                'limit': limit,
+                'previous_limit': previous_limit,
+                'direction': 'increase' if limit > previous_limit else 'decrease',
+            }))
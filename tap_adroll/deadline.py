@@ -0,0 +1,43 @@
+import time
+
+DEFAULT_DEADLINE_MARGIN = 60.0
+
+
+class SyncDeadlineReached(Exception):
+    pass
+
+
+class Deadline():
+    """Time budget for a whole run, counted from when it is created.
+
+    New partitions should not be started once less than `margin` seconds
+    remain, and no request is sent once the budget is spent.
+    """
+
+    def __init__(self, seconds=None, margin=DEFAULT_DEADLINE_MARGIN, clock=time.monotonic):
+        self.clock = clock
+        self.margin = margin
+        self.expires_at = clock() + seconds if seconds else None
+
+    @classmethod
+    def from_config(cls, config):
+        margin = config.get('deadline_margin_seconds')
+        return cls(seconds=float(config.get('sync_deadline_seconds') or 0) or None,
+                   margin=DEFAULT_DEADLINE_MARGIN if margin in (None, '') else float(margin))
+
+    def remaining(self):
+        if self.expires_at is None:
+            return None
+        return self.expires_at - self.clock()
+
+    def check(self):
+        """Raises if a new partition should not be started."""
+        remaining = self.remaining()
+        if remaining is not None and remaining <= self.margin:
+            raise SyncDeadlineReached("Sync deadline is {:.0f} seconds away".format(max(0.0, remaining)))
+
+    def check_expired(self):
+        """Raises if the deadline has passed."""
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise SyncDeadlineReached("Sync deadline has passed")
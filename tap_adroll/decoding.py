@@ -0,0 +1,61 @@
+import json
+import re
+
+import singer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+LOGGER = singer.get_logger()
+
+DECODERS = ['auto', 'orjson', 'stdlib']
+
+# orjson decodes integers outside the int64 and uint64 ranges as floats
+# instead of raising. Those below int64 take as few as this many digits.
+WIDE_INTEGER_DIGITS = 19
+WIDE_INTEGER = re.compile(r'[0-9]{%d}' % WIDE_INTEGER_DIGITS)
+# Maps every digit to '0' and anything else to a space
+DIGITS_TO_ZEROS = bytes(ord('0') if chr(byte).isdigit() and byte < 128 else ord(' ') for byte in range(256))
+
+
+def has_wide_integer(content):
+    """Whether `content` has a run of digits long enough to be an integer orjson cannot hold."""
+    if isinstance(content, str):
+        return WIDE_INTEGER.search(content) is not None
+    # Translating then searching for a fixed run is far faster than a regex on large bodies
+    return b'0' * WIDE_INTEGER_DIGITS in bytes(content).translate(DIGITS_TO_ZEROS)
+
+
+def stdlib_loads(content):
+    return json.loads(content)
+
+
+def orjson_loads(content):
+    # orjson rejects a few documents the stdlib accepts, like NaN, numbers
+    # overflowing a double and lone surrogates, so those are retried with it.
+    # Documents that may hold integers too wide for it go to the stdlib too,
+    # as orjson would silently turn them into floats.
+    if has_wide_integer(content):
+        return json.loads(content)
+    try:
+        return orjson.loads(content)  # pylint: disable=no-member
+    except orjson.JSONDecodeError:  # pylint: disable=no-member
+        return json.loads(content)
+
+
+def get_decoder(name=None):
+    """Returns the function decoding raw response bodies.
+
+    `auto` uses orjson when it is installed and the stdlib otherwise. Both
+    decode every document to the same values.
+    """
+    name = name or 'auto'
+    if name not in DECODERS:
+        raise Exception("Unknown json_decoder {}, expected one of {}".format(name, ', '.join(DECODERS)))
+    if name == 'orjson' and orjson is None:
+        raise Exception("json_decoder orjson requires the orjson package, install tap-adroll[fast-json]")
+    if name == 'stdlib' or orjson is None:
+        return stdlib_loads
+    return orjson_loads
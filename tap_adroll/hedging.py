@@ -0,0 +1,122 @@
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import singer
+from singer import metrics
+
+LOGGER = singer.get_logger()
+
+DEFAULT_HEDGE_ENDPOINTS = ['report/ad']
+DEFAULT_HEDGE_PERCENTILE = 95.0
+DEFAULT_HEDGE_MIN_SAMPLES = 20
+DEFAULT_HEDGE_WORKERS = 16
+LATENCY_SAMPLES = 500
+
+
+def latency_percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def _timed(func, *args, **kwargs):
+    started_at = time.monotonic()
+    response = func(*args, **kwargs)
+    return response, time.monotonic() - started_at
+
+
+def _close_response(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result()[0].close()
+
+
+class RequestHedger():
+    """Sends a duplicate of a slow request and takes whichever answers first.
+
+    Once an endpoint has `min_samples` latencies recorded, a request still
+    outstanding after the `percentile` latency is hedged with a second copy.
+    The loser is cancelled if it has not started, and its response is closed
+    when it arrives otherwise.
+    """
+
+    def __init__(self, endpoints=None, percentile=DEFAULT_HEDGE_PERCENTILE,
+                 min_samples=DEFAULT_HEDGE_MIN_SAMPLES, max_workers=DEFAULT_HEDGE_WORKERS):
+        self.endpoints = set(DEFAULT_HEDGE_ENDPOINTS if endpoints is None else endpoints)
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='adroll-hedge')
+        self.latencies = {}
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, max_workers=DEFAULT_HEDGE_WORKERS):
+        endpoints = config.get('hedge_endpoints')
+        if isinstance(endpoints, str):
+            endpoints = json.loads(endpoints)
+        return cls(endpoints=endpoints,
+                   percentile=float(config.get('hedge_percentile') or DEFAULT_HEDGE_PERCENTILE),
+                   min_samples=int(config.get('hedge_min_samples') or DEFAULT_HEDGE_MIN_SAMPLES),
+                   max_workers=max_workers)
+
+    def applies_to(self, endpoint):
+        return endpoint in self.endpoints
+
+    def record(self, endpoint, latency):
+        with self.lock:
+            self.latencies.setdefault(endpoint, deque(maxlen=LATENCY_SAMPLES)).append(latency)
+
+    def delay(self, endpoint):
+        with self.lock:
+            samples = list(self.latencies.get(endpoint, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return latency_percentile(samples, self.percentile)
+
+    def _count(self, endpoint, key):
+        with self.lock:
+            stats = self.stats.setdefault(endpoint, {'hedged': 0, 'hedge_wins': 0})
+            stats[key] += 1
+
+    def call(self, endpoint, func, *args, **kwargs):
+        hedge_after = self.delay(endpoint)
+        if hedge_after is None:
+            response, latency = _timed(func, *args, **kwargs)
+            self.record(endpoint, latency)
+            return response
+
+        primary = self.executor.submit(_timed, func, *args, **kwargs)
+        done, _ = wait([primary], timeout=hedge_after)
+        if done:
+            response, latency = primary.result()
+            self.record(endpoint, latency)
+            return response
+
+        self._count(endpoint, 'hedged')
+        hedge = self.executor.submit(_timed, func, *args, **kwargs)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                for loser in {primary, hedge} - {future}:
+                    if not loser.cancel():
+                        loser.add_done_callback(_close_response)
+                response, latency = future.result()
+                self.record(endpoint, latency)
+                if future is hedge:
+                    self._count(endpoint, 'hedge_wins')
+                return response
+        raise error
+
+    def log_summary(self):
+        for endpoint, stats in sorted(self.stats.items()):
+            for metric in ('hedged', 'hedge_wins'):
+                metrics.log(LOGGER, metrics.Point('counter', metric, stats[metric],
+                                                  {metrics.Tag.endpoint: endpoint}))
@@ -0,0 +1,63 @@
+import threading
+
+import singer
+from singer import metrics
+
+LOGGER = singer.get_logger()
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = [0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+LATENCY_BUCKET_METRIC = 'http_request_duration_bucket'
+
+
+class HttpMetrics():
+    """Emits timer metrics for HTTP responses and latency histograms per endpoint.
+
+    Every response gets a timer point unless sampling is turned on with
+    `metric_sample_every`, in which case only the first of every
+    `sample_every` responses with the same endpoint and status code gets one;
+    every response is still counted in the histograms. Histograms are cumulative like
+    Prometheus ones, one `counter` point per bucket whose value counts the
+    requests that took at most `le` seconds. They cover the requests since
+    the previous histograms were logged.
+    """
+
+    def __init__(self, buckets=None, sample_every=1):
+        self.buckets = sorted(LATENCY_BUCKETS if buckets is None else buckets)
+        self.sample_every = max(1, sample_every)
+        self.counts = {}
+        self.latencies = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(sample_every=int(config.get('metric_sample_every') or 1))
+
+    def record(self, endpoint, latency, status_code=None, response_bytes=None):
+        with self.lock:
+            self.latencies.setdefault(endpoint, []).append(latency)
+            count = self.counts[endpoint, status_code] = self.counts.get((endpoint, status_code), 0) + 1
+        if (count - 1) % self.sample_every != 0:
+            return
+
+        # A status code of None is a request that got no response at all
+        failed = status_code is None or status_code >= 400
+        tags = {
+            metrics.Tag.endpoint: endpoint,
+            metrics.Tag.http_status_code: status_code,
+            metrics.Tag.status: 'failed' if failed else 'succeeded',
+            'response_bytes': response_bytes,
+        }
+        metrics.log(LOGGER, metrics.Point('timer', metrics.Metric.http_request_duration, latency, tags))
+
+    def log_histograms(self, stream=None):
+        with self.lock:
+            latencies, self.latencies = self.latencies, {}
+
+        for endpoint, samples in sorted(latencies.items()):
+            tags = {metrics.Tag.endpoint: endpoint}
+            if stream:
+                tags['stream'] = stream
+            for bound in self.buckets + ['+Inf']:
+                count = len(samples) if bound == '+Inf' else sum(1 for sample in samples if sample <= bound)
+                metrics.log(LOGGER, metrics.Point('counter', LATENCY_BUCKET_METRIC, count, {**tags, 'le': bound}))
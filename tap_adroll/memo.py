@@ -0,0 +1,93 @@
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import singer
+
+from tap_adroll.cache import cache_key
+
+LOGGER = singer.get_logger()
+
+# Parent endpoints every child stream reads again
+DEFAULT_MEMO_ENDPOINTS = ['organization/get', 'organization/get_advertisables']
+DEFAULT_MEMO_MAX_BYTES = 64 * 1024 * 1024
+
+
+class RequestMemo():  # pylint: disable=too-many-instance-attributes
+    """Serves repeated GETs of the same endpoint and params from memory for one run.
+
+    Only endpoints in `endpoints` are memoized, as raw bodies so every caller
+    decodes its own copy of the records. Concurrent callers of a request
+    that is in flight wait for it instead of sending their own, and failed
+    requests are not remembered. Least recently used bodies are dropped
+    once they add up to more than `max_bytes`.
+    """
+
+    def __init__(self, endpoints=None, max_bytes=DEFAULT_MEMO_MAX_BYTES):
+        self.endpoints = set(DEFAULT_MEMO_ENDPOINTS if endpoints is None else endpoints)
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        endpoints = config.get('memo_endpoints')
+        if isinstance(endpoints, str):
+            endpoints = json.loads(endpoints)
+        return cls(endpoints=endpoints,
+                   max_bytes=int(config.get('memo_max_bytes') or DEFAULT_MEMO_MAX_BYTES))
+
+    def applies_to(self, endpoint):
+        return endpoint in self.endpoints
+
+    def get(self, endpoint, params, fetch):
+        """Returns the body of the request, calling `fetch` only if no other caller has."""
+        key = cache_key(endpoint, params)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][1]
+            future = self.in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self.in_flight[key] = Future()
+                self.misses += 1
+            else:
+                self.hits += 1
+        if not leader:
+            return future.result()
+
+        try:
+            content = fetch()
+        except BaseException as e:
+            with self.lock:
+                del self.in_flight[key]
+            future.set_exception(e)
+            raise
+
+        with self.lock:
+            del self.in_flight[key]
+            self.entries[key] = (endpoint, content)
+            self.size += len(content)
+            while self.size > self.max_bytes and self.entries:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+        future.set_result(content)
+        return content
+
+    def invalidate(self, endpoint=None):
+        """Forgets the bodies of `endpoint`, or of every endpoint."""
+        with self.lock:
+            for key, (entry_endpoint, content) in list(self.entries.items()):
+                if endpoint is None or entry_endpoint == endpoint:
+                    del self.entries[key]
+                    self.size -= len(content)
+
+    def log_summary(self):
+        LOGGER.info("Request memo: %s hits, %s misses", self.hits, self.misses)
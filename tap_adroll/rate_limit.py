@@ -0,0 +1,130 @@
+import email.utils
+import json
+import threading
+import time
+
+import singer
+
+LOGGER = singer.get_logger()
+
+# Pause applied after a 429 that carries no usable Retry-After header
+DEFAULT_THROTTLE_PAUSE = 1.0
+# Fraction of the configured rate restored after each successful request
+RATE_RECOVERY_STEP = 0.05
+MIN_RATE = 0.1
+
+
+def parse_retry_after(value):
+    """Returns the number of seconds a Retry-After header asks us to wait, or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class TokenBucket():  # pylint: disable=too-many-instance-attributes
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        self.configured_rate = float(rate)
+        self.rate = self.configured_rate
+        self.capacity = float(capacity or max(1.0, self.configured_rate))
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated_at = clock()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self):
+        """Takes one token and returns how long the caller must wait before using it.
+
+        Tokens may go negative so that concurrent callers queue up behind each
+        other instead of all waking at once.
+        """
+        with self.lock:
+            now = self.clock()
+            self._refill(now)
+            self.tokens -= 1
+            wait = max(0.0, -self.tokens / self.rate)
+            return max(wait, self.paused_until - now)
+
+    def throttle(self, pause):
+        with self.lock:
+            now = self.clock()
+            self._refill(now)
+            self.paused_until = max(self.paused_until, now + pause)
+            self.rate = max(MIN_RATE, self.rate / 2)
+            # Drop any saved-up burst so the pause is not followed by a flood
+            self.tokens = min(self.tokens, 0.0)
+
+    def recover(self):
+        with self.lock:
+            if self.rate < self.configured_rate:
+                self.rate = min(self.configured_rate,
+                                self.rate + self.configured_rate * RATE_RECOVERY_STEP)
+
+
+class RateLimiter():
+    """Shared requests/sec budget with optional per-endpoint overrides.
+
+    Endpoints with an override are limited by both their own bucket and the
+    global one. A 429 pauses and slows down the bucket governing the endpoint.
+    Without any configured rate only the Retry-After pauses apply.
+    """
+
+    def __init__(self, rate=None, endpoint_rates=None, clock=time.monotonic, sleep=None):
+        self.clock = clock
+        self.sleep = sleep
+        self.global_bucket = TokenBucket(rate, clock=clock) if rate else None
+        self.endpoint_buckets = {endpoint: TokenBucket(endpoint_rate, clock=clock)
+                                 for endpoint, endpoint_rate in (endpoint_rates or {}).items()}
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        endpoint_rates = config.get('endpoint_requests_per_second') or {}
+        if isinstance(endpoint_rates, str):
+            endpoint_rates = json.loads(endpoint_rates)
+        return cls(rate=float(config.get('requests_per_second') or 0) or None,
+                   endpoint_rates={endpoint: float(rate) for endpoint, rate in endpoint_rates.items()})
+
+    def _buckets(self, endpoint):
+        buckets = []
+        if endpoint in self.endpoint_buckets:
+            buckets.append(self.endpoint_buckets[endpoint])
+        if self.global_bucket:
+            buckets.append(self.global_bucket)
+        return buckets
+
+    def acquire(self, endpoint):
+        wait = max([bucket.reserve() for bucket in self._buckets(endpoint)] + [0.0])
+        with self.lock:
+            wait = max(wait, self.paused_until - self.clock())
+        if wait > 0:
+            (self.sleep or time.sleep)(wait)
+
+    def throttled(self, endpoint, retry_after=None):
+        pause = DEFAULT_THROTTLE_PAUSE if retry_after is None else retry_after
+        LOGGER.warning("Rate limited on endpoint %s, pausing for %.1f seconds", endpoint, pause)
+        buckets = self._buckets(endpoint)
+        if buckets:
+            buckets[0].throttle(pause)
+        else:
+            with self.lock:
+                self.paused_until = max(self.paused_until, self.clock() + pause)
+
+    def succeeded(self, endpoint):
+        for bucket in self._buckets(endpoint):
+            bucket.recover()
@@ -0,0 +1,35 @@
+import threading
+
+import singer
+
+LOGGER = singer.get_logger()
+
+
+class AdvertisableRegistry():
+    """The advertisables of the organization, fetched once and shared by every stream.
+
+    The first caller fetches the full list while concurrent callers wait
+    for it, and it is only published once completely read, so a caller
+    that stops early or a failed request never leaves a partial list
+    behind. Records are shared between callers and must not be modified.
+    """
+
+    def __init__(self):
+        self.advertisables = None
+        self.lock = threading.Lock()
+
+    def records(self, fetch):
+        """Returns every advertisable record, calling `fetch` for them if not known yet."""
+        with self.lock:
+            if self.advertisables is None:
+                self.advertisables = tuple(fetch())
+                LOGGER.info("Found %s advertisables", len(self.advertisables))
+            return self.advertisables
+
+    def eids(self, fetch):
+        return [rec['eid'] for rec in self.records(fetch)]
+
+    def invalidate(self):
+        # The next caller fetches the advertisables again
+        with self.lock:
+            self.advertisables = None
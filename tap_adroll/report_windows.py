@@ -0,0 +1,52 @@
+import singer
+
+LOGGER = singer.get_logger()
+
+DEFAULT_WINDOW_DAYS = 1
+# A request slower than this halves the report windows
+DEFAULT_TARGET_SECONDS = 30.0
+# A response with more rows than this halves the report windows
+DEFAULT_MAX_RECORDS = 10000
+
+
+class ReportWindowSizer():
+    """Picks how many days each report request covers, up to `max_days`.
+
+    Windows start at `max_days`. Each request is observed once read: one
+    that failed, was slow or returned many rows halves the next windows,
+    and one well under both limits grows them by a day. A window cut
+    before a decrease cannot trigger another one, so requests in flight
+    together only halve it once.
+    """
+
+    def __init__(self, max_days=DEFAULT_WINDOW_DAYS, target_seconds=DEFAULT_TARGET_SECONDS,
+                 max_records=DEFAULT_MAX_RECORDS):
+        self.max_days = max(1, max_days)
+        self.target_seconds = target_seconds
+        self.max_records = max_records
+        self.days = self.max_days
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(max_days=int(config.get('report_window_days') or DEFAULT_WINDOW_DAYS),
+                   target_seconds=float(config.get('report_window_target_seconds') or DEFAULT_TARGET_SECONDS),
+                   max_records=int(config.get('report_window_max_records') or DEFAULT_MAX_RECORDS))
+
+    def windows(self, report_dates):
+        # Windows are cut lazily, so each one gets the size known when it starts
+        start = 0
+        while start < len(report_dates):
+            window = tuple(report_dates[start:start + self.days])
+            start += len(window)
+            yield window
+
+    def observe(self, days, records, latency, failed=False):
+        if failed or latency > self.target_seconds or records > self.max_records:
+            smaller = max(1, days // 2)
+            if smaller < self.days:
+                LOGGER.info("Shrinking report windows from %s to %s days after a window of %s days "
+                            "with %s rows in %.1f seconds", self.days, smaller, days, records, latency)
+                self.days = smaller
+        elif (days >= self.days and latency < self.target_seconds / 2
+              and records < self.max_records / 2):
+            self.days = min(self.max_days, self.days + 1)
@@ -0,0 +1,76 @@
+import threading
+import time
+
+import singer
+
+from tap_adroll.hedging import latency_percentile
+
+LOGGER = singer.get_logger()
+
+DEFAULT_LOG_SAMPLE_EVERY = 100
+DEFAULT_LOG_SUMMARY_INTERVAL = 60.0
+
+
+class RequestLog():  # pylint: disable=too-many-instance-attributes
+    """Logs per-request lines in full, or a sample of them plus periodic summaries.
+
+    When not `verbose`, only the first of every `sample_every` lines with the
+    same message is logged. Every `summary_interval` seconds, and at the end
+    of the run, the requests made since the last summary are logged per
+    endpoint with their rate, p50/p95 latency and errors.
+    """
+
+    def __init__(self, verbose=False, sample_every=DEFAULT_LOG_SAMPLE_EVERY,
+                 summary_interval=DEFAULT_LOG_SUMMARY_INTERVAL, clock=time.monotonic):
+        self.verbose = verbose
+        self.sample_every = max(1, sample_every)
+        self.summary_interval = summary_interval
+        self.clock = clock
+        self.counts = {}
+        self.latencies = {}
+        self.errors = {}
+        self.interval_started_at = clock()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, verbose=False):
+        return cls(verbose=verbose,
+                   sample_every=int(config.get('log_sample_every') or DEFAULT_LOG_SAMPLE_EVERY),
+                   summary_interval=float(config.get('log_summary_interval') or DEFAULT_LOG_SUMMARY_INTERVAL))
+
+    def info(self, msg, *args):
+        if self.verbose:
+            LOGGER.info(msg, *args)
+            return
+        with self.lock:
+            count = self.counts[msg] = self.counts.get(msg, 0) + 1
+        if (count - 1) % self.sample_every == 0:
+            LOGGER.info(msg, *args)
+
+    def record(self, endpoint, latency, error=False):
+        with self.lock:
+            self.latencies.setdefault(endpoint, []).append(latency)
+            if error:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+        self.summarize()
+
+    def summarize(self, force=False):
+        now = self.clock()
+        with self.lock:
+            elapsed = now - self.interval_started_at
+            if not force and elapsed < self.summary_interval:
+                return
+            latencies, errors = self.latencies, self.errors
+            self.latencies, self.errors = {}, {}
+            self.interval_started_at = now
+
+        if not latencies:
+            return
+        elapsed = max(elapsed, 1e-9)
+        LOGGER.info("%s requests in the last %.0fs (%.1f/s)",
+                    sum(len(samples) for samples in latencies.values()), elapsed,
+                    sum(len(samples) for samples in latencies.values()) / elapsed)
+        for endpoint, samples in sorted(latencies.items()):
+            LOGGER.info("Endpoint %s: %s requests (%.1f/s), p50 %.3fs, p95 %.3fs, %s errors",
+                        endpoint, len(samples), len(samples) / elapsed, latency_percentile(samples, 50),
+                        latency_percentile(samples, 95), errors.get(endpoint, 0))
@@ -0,0 +1,93 @@
+import random
+import threading
+import time
+
+import requests
+import singer
+
+from tap_adroll.rate_limit import parse_retry_after
+
+LOGGER = singer.get_logger()
+
+DEFAULT_MAX_TRIES = 3
+DEFAULT_BASE_DELAY = 2.0
+DEFAULT_MAX_DELAY = 60.0
+
+RETRYABLE_EXCEPTIONS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+
+def is_retryable(exc):
+    if isinstance(exc, requests.exceptions.HTTPError):
+        # Without a response we cannot tell what went wrong, so try again
+        if exc.response is None:
+            return True
+        status_code = exc.response.status_code
+        return status_code == 429 or status_code >= 500
+    return isinstance(exc, RETRYABLE_EXCEPTIONS)
+
+
+class RetryPolicy():
+    """Retries transient failures with exponential backoff and full jitter.
+
+    Non-retryable 4xx responses fail on the first attempt. A Retry-After
+    header on the response replaces the computed delay. Attempts, retries and
+    time spent sleeping are counted per endpoint in `stats`.
+    """
+
+    def __init__(self, max_tries=DEFAULT_MAX_TRIES, base_delay=DEFAULT_BASE_DELAY,
+                 max_delay=DEFAULT_MAX_DELAY, sleep=None):
+        self.max_tries = max_tries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(max_tries=int(config.get('max_tries') or DEFAULT_MAX_TRIES),
+                   base_delay=float(config.get('retry_base_delay') or DEFAULT_BASE_DELAY),
+                   max_delay=float(config.get('retry_max_delay') or DEFAULT_MAX_DELAY))
+
+    def delay(self, attempt, exc):
+        response = getattr(exc, 'response', None)
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def _record(self, endpoint, retried=False, slept=0.0):
+        with self.lock:
+            stats = self.stats.setdefault(endpoint, {'attempts': 0, 'retries': 0, 'sleep_seconds': 0.0})
+            if retried:
+                stats['retries'] += 1
+                stats['sleep_seconds'] += slept
+            else:
+                stats['attempts'] += 1
+
+    def call(self, endpoint, func, *args, **kwargs):
+        attempt = 0
+        while True:
+            attempt += 1
+            self._record(endpoint)
+            try:
+                return func(*args, **kwargs)
+            except Exception as exc:
+                if not is_retryable(exc) or attempt >= self.max_tries:
+                    raise
+                wait = self.delay(attempt, exc)
+                LOGGER.warning("Attempt %s of %s to endpoint %s failed with %r, retrying in %.1f seconds",
+                               attempt, self.max_tries, endpoint, exc, wait)
+                self._record(endpoint, retried=True, slept=wait)
+                (self.sleep or time.sleep)(wait)
+
+    def log_summary(self):
+        for endpoint, stats in sorted(self.stats.items()):
+            if stats['retries']:
+                LOGGER.info("Endpoint %s: %s attempts, %s retries, %.1f seconds sleeping before retries",
+                            endpoint, stats['attempts'], stats['retries'], stats['sleep_seconds'])
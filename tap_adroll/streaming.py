@@ -0,0 +1,161 @@
+import codecs
+import json
+import re
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+STRUCTURAL = re.compile(r'["{}\[\]]')
+STRING_TAIL = re.compile(r'(?:[^"\\]|\\.)*"', re.DOTALL)
+SCALAR = re.compile(r'[^,:\]}\s]+')
+
+SCANNER = json.JSONDecoder()
+
+# Consumed text is dropped from the buffer once it grows past this many characters
+COMPACT_AFTER = 64 * 1024
+
+
+class _Buffer():
+    """Decoded text of a response body, read from `chunks` as the parser needs it."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.text = ''
+        self.pos = 0
+        self.eof = False
+
+    def more(self):
+        while not self.eof:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                self.eof = True
+                text = self.decoder.decode(b'', final=True)
+            else:
+                text = self.decoder.decode(chunk)
+            if text:
+                self.text += text
+                return True
+        return False
+
+    def compact(self):
+        if self.pos > COMPACT_AFTER:
+            self.text = self.text[self.pos:]
+            self.pos = 0
+
+    def peek(self):
+        # Skips whitespace and returns the next character without consuming it
+        while True:
+            self.pos = WHITESPACE.match(self.text, self.pos).end()
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.more():
+                raise ValueError("Unexpected end of JSON response")
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError("Expected {!r} at position {} of JSON response".format(char, self.pos))
+        self.pos += 1
+
+    def _search(self, pattern, pos):
+        # Searches from `pos`, reading more text until `pattern` matches
+        while True:
+            match = pattern.search(self.text, pos)
+            if match is not None:
+                return match
+            if not self.more():
+                raise ValueError("Unexpected end of JSON response")
+
+    def _string_end(self, pos):
+        # `pos` is just after an opening quote
+        while True:
+            match = STRING_TAIL.match(self.text, pos)
+            if match is not None:
+                return match.end()
+            if not self.more():
+                raise ValueError("Unterminated string in JSON response")
+
+    def decode(self):
+        """Decodes the JSON value starting at `pos` with the stdlib's C scanner and moves past it."""
+        if self.peek() not in '{["':
+            # A number or literal only ends once the next character is known
+            end = self.value_end()
+            value = json.loads(self.text[self.pos:end])
+            self.pos = end
+            return value
+        while True:
+            try:
+                value, self.pos = SCANNER.raw_decode(self.text, self.pos)
+                return value
+            except json.JSONDecodeError as exc:
+                # Most likely cut off by the end of what was read so far
+                if not self.more():
+                    raise ValueError("Malformed JSON response: {}".format(exc)) from exc
+
+    def value_end(self):
+        """Returns the end of the JSON value starting at `pos`, without decoding it."""
+        char = self.peek()
+        start = self.pos
+        if char == '"':
+            return self._string_end(start + 1)
+        if char in '{[':
+            depth = 0
+            pos = start
+            while True:
+                match = self._search(STRUCTURAL, pos)
+                token = match.group()
+                if token == '"':
+                    pos = self._string_end(match.end())
+                    continue
+                pos = match.end()
+                depth += 1 if token in '{[' else -1
+                if depth == 0:
+                    return pos
+        # A number or literal, which only ends once the next character is known
+        while True:
+            match = SCALAR.match(self.text, start)
+            if match is None:
+                raise ValueError("Unexpected {!r} at position {} of JSON response".format(char, start))
+            if match.end() < len(self.text) or not self.more():
+                return match.end()
+
+
+def iter_json_array(chunks, key='results'):
+    """Yields the items of the array under `key` of a JSON object as they arrive.
+
+    `chunks` are the raw bytes of the body. Only one item is held in memory
+    at a time, each decoded by the stdlib's C scanner as soon as it is
+    complete. Yields nothing when `key` is missing or null.
+    """
+    buffer = _Buffer(chunks)
+    buffer.expect('{')
+    if buffer.peek() == '}':
+        return
+    while True:
+        if buffer.peek() != '"':
+            raise ValueError("Expected a key at position {} of JSON response".format(buffer.pos))
+        end = buffer.value_end()
+        name = json.loads(buffer.text[buffer.pos:end])
+        buffer.pos = end
+        buffer.expect(':')
+
+        if name == key and buffer.peek() == '[':
+            buffer.pos += 1
+            if buffer.peek() == ']':
+                return
+            while True:
+                yield buffer.decode()
+                separator = buffer.peek()
+                buffer.pos += 1
+                if separator == ']':
+                    return
+                if separator != ',':
+                    raise ValueError("Expected ',' or ']' at position {} of JSON response".format(buffer.pos - 1))
+                buffer.compact()
+
+        buffer.pos = buffer.value_end()
+        separator = buffer.peek()
+        buffer.pos += 1
+        if separator == '}':
+            return
+        if separator != ',':
+            raise ValueError("Expected ',' or '}}' at position {} of JSON response".format(buffer.pos - 1))
+        buffer.compact()
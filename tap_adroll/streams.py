@@ -1,16 +1,211 @@
+import asyncio
 import datetime
+import functools
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from singer import utils
 import singer
 
+from .circuit_breaker import is_partition_failure
+from .client import DEFAULT_ASYNC_CONCURRENCY, get_config_bool
+from .report_windows import DEFAULT_WINDOW_DAYS, ReportWindowSizer
+
 LOGGER = singer.get_logger()
 
+# Asks report/ad for one row per entity and day when a request covers several days
+DATE_BREAKDOWN_PARAMS = {'breakdowns': 'date'}
+
+
+async def _cancel_pending_tasks():
+    pending = asyncio.all_tasks() - {asyncio.current_task()}
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+
+def iterate_async(async_generator, max_workers):
+    """Drive an async generator from synchronous code on a private event loop."""
+    loop = asyncio.new_event_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=max_workers))
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(async_generator.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(async_generator.aclose())
+        loop.run_until_complete(_cancel_pending_tasks())
+        loop.run_until_complete(loop.shutdown_default_executor())
+        loop.close()
+
 
 class Stream:
+    stream_id = None
+    stream_name = None
+    endpoint = None
+
     def __init__(self, client, config, state):
         self.client = client
         self.config = config
         self.state = state
+        # Partitions that failed during this run
+        self.failed = []
+        self.failures_changed = False
+
+    @property
+    def async_concurrency(self):
+        return int(self.config.get('async_concurrency') or DEFAULT_ASYNC_CONCURRENCY)
+
+    @property
+    def ordered_partitions(self):
+        return get_config_bool(self.config, 'ordered_partitions')
+
+    @property
+    def skip_unchanged(self):
+        return get_config_bool(self.config, 'skip_unchanged_partitions')
+
+    def partition_validators(self):
+        # Response validators from the last run, per advertisable
+        bookmark = self.state.setdefault('bookmarks', {}).setdefault(self.stream_name, {})
+        return bookmark.setdefault('validators', {})
+
+    def fetch_partition(self, advertisable_eid):
+        """Returns the records for one advertisable and the validators of the response.
+
+        Records are parsed as the response is downloaded. When skipping
+        unchanged partitions, an advertisable whose response has not changed
+        since the last run has no records.
+        """
+        params = {'advertisable': advertisable_eid}
+        if not self.skip_unchanged:
+            return self.client.get_results(self.endpoint, params=params), None
+
+        previous = self.partition_validators().get(advertisable_eid)
+        records, validators = self.client.get_if_changed(self.endpoint, params=params, validators=previous)
+        if records is None:
+            self.client.request_log.info("Skipping %s for advertisable %s, unchanged since the last run",
+                                         self.stream_id, advertisable_eid)
+            return [], validators
+        return records.get('results'), validators
+
+    def commit_partition(self, advertisable_eid, validators):
+        # Only called once every record of the partition has been emitted
+        if validators is not None:
+            self.partition_validators()[advertisable_eid] = validators
+        self.partition_succeeded({'advertisable': advertisable_eid})
+
+    def failed_partitions(self):
+        # Partitions the API failed to serve, kept in the state to be retried
+        return self.state.get('bookmarks', {}).get(self.stream_name, {}).get('failed_partitions', [])
+
+    def partition_failed(self, partition, exc):
+        LOGGER.error("Failed to sync %s for %s, recording it to retry: %s", self.stream_id, partition, exc)
+        self.failed.append(partition)
+        bookmark = self.state.setdefault('bookmarks', {}).setdefault(self.stream_name, {})
+        failed = bookmark.setdefault('failed_partitions', [])
+        if partition not in failed:
+            failed.append(partition)
+            self.failures_changed = True
+
+    def partition_succeeded(self, partition):
+        bookmark = self.state.get('bookmarks', {}).get(self.stream_name, {})
+        failed = bookmark.get('failed_partitions', [])
+        if partition in failed:
+            failed.remove(partition)
+            if not failed:
+                del bookmark['failed_partitions']
+            self.failures_changed = True
+
+    @staticmethod
+    def fetch_or_failure(fetch, advertisable_eid):
+        # Returns what `fetch` returned, or the exception if the API failed to serve the partition
+        try:
+            return fetch(advertisable_eid), None
+        except Exception as exc:  # pylint: disable=broad-except
+            if not is_partition_failure(exc):
+                raise
+            return None, exc
+
+    def sync_per_advertisable(self):
+        advertisables = Advertisables(self.client, self.config, self.state)
+        for advertisable_eid in advertisables.get_all_advertisable_eids():
+            self.client.deadline.check()
+            try:
+                records, validators = self.fetch_partition(advertisable_eid)
+                for rec in records:
+                    yield rec
+            except Exception as exc:  # pylint: disable=broad-except
+                if not is_partition_failure(exc):
+                    raise
+                self.partition_failed({'advertisable': advertisable_eid}, exc)
+                continue
+            self.commit_partition(advertisable_eid, validators)
+
+        if self.skip_unchanged or self.failures_changed:
+            singer.write_state(self.state)
+
+    async def fan_out_async(self, items, fetch):
+        """Yields `(item, fetch(item))` pairs, with at most `async_concurrency` fetches in flight.
+
+        Pairs come as each fetch completes, or in the order of `items` with
+        `ordered_partitions`, in which case one slow fetch holds back those
+        after it. A fetch only starts once an earlier result is taken, so at
+        most `async_concurrency` results are held at once, and items not
+        started yet are never fetched if the generator is closed.
+        """
+        loop = asyncio.get_running_loop()
+        items = iter(items)
+        pending = deque()
+
+        def submit():
+            for item in items:
+                self.client.deadline.check()
+                pending.append((item, loop.run_in_executor(None, fetch, item)))
+                return
+
+        try:
+            for _ in range(self.async_concurrency):
+                submit()
+            while pending:
+                if self.ordered_partitions:
+                    await asyncio.wait([pending[0][1]])
+                    item, future = pending.popleft()
+                else:
+                    done, _ = await asyncio.wait([future for _, future in pending],
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                    item, future = [entry for entry in pending if entry[1] in done][0]
+                    pending.remove((item, future))
+                # Keep the executor busy while the caller handles this result
+                submit()
+                yield item, future.result()
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+    def fetch_partition_list(self, advertisable_eid):
+        # Reads the whole partition on a worker thread, rather than on the
+        # event loop or whichever thread consumes the records
+        records, validators = self.fetch_partition(advertisable_eid)
+        return list(records), validators
+
+    async def sync_per_advertisable_async(self):
+        advertisables = Advertisables(self.client, self.config, self.state)
+        advertisable_eids = await advertisables.get_all_advertisable_eids_async()
+        fetch = functools.partial(self.fetch_or_failure, self.fetch_partition_list)
+        async for advertisable_eid, (result, exc) in self.fan_out_async(advertisable_eids, fetch):
+            if exc is not None:
+                self.partition_failed({'advertisable': advertisable_eid}, exc)
+                continue
+            records, validators = result
+            for rec in records:
+                yield rec
+            self.commit_partition(advertisable_eid, validators)
+
+        if self.skip_unchanged or self.failures_changed:
+            singer.write_state(self.state)
 
 
 class Advertisables(Stream):
@@ -21,22 +216,24 @@ class Advertisables(Stream):
     replication_method = "FULL_TABLE"
     replication_keys = []
 
-    advertisable_eids = []
+    def fetch_all(self):
+        return self.client.advertisables.records(functools.partial(self.client.get_results, self.endpoint))
 
     def get_all_advertisable_eids(self):
-        if Advertisables.advertisable_eids:
-            for eid in Advertisables.advertisable_eids:
-                yield eid
-        else:
-            records = self.client.get(self.endpoint)
-            for rec in records.get('results'):
-                Advertisables.advertisable_eids.append(rec['eid'])
-                yield rec['eid']
+        return self.client.advertisables.eids(functools.partial(self.client.get_results, self.endpoint))
+
+    async def get_all_advertisable_eids_async(self):
+        # Fetched on the executor, as the registry blocks while another caller fetches them
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.get_all_advertisable_eids)
 
 
     def sync(self):
-        records = self.client.get(self.endpoint)
-        for rec in records.get('results'):
+        yield from self.fetch_all()
+
+    async def sync_async(self):
+        loop = asyncio.get_running_loop()
+        for rec in await loop.run_in_executor(None, self.fetch_all):
             yield rec
 
 
@@ -50,13 +247,11 @@ class Ads(Stream):
 
 
     def sync(self):
-        advertisables = Advertisables(self.client, self.config, self.state)
-        for advertisable_eid in advertisables.get_all_advertisable_eids():
-            records = self.client.get(self.endpoint, params={
-                'advertisable': advertisable_eid
-            })
-            for rec in records.get('results'):
-                yield rec
+        yield from self.sync_per_advertisable()
+
+    async def sync_async(self):
+        async for rec in self.sync_per_advertisable_async():
+            yield rec
 
 
 class AdReports(Stream):
@@ -68,8 +263,7 @@ class AdReports(Stream):
     replication_keys = ["date"]
 
 
-    def generate_daily_date_windows(self):
-        bookmark = singer.bookmarks.get_bookmark(self.state, self.stream_name, self.replication_keys[0])
+    def generate_daily_date_windows(self, bookmark=None):
         lookback_window = datetime.timedelta(days=int(self.config.get('lookback_window') or 7))
         report_date = min(utils.strptime_to_utc(bookmark or self.config['start_date']),
                           utils.now() - lookback_window)
@@ -88,27 +282,238 @@ class AdReports(Stream):
             yield report_date
             report_date += datetime.timedelta(days=1)
 
+    @property
+    def report_window_days(self):
+        return int(self.config.get('report_window_days') or DEFAULT_WINDOW_DAYS)
+
+    def get_report(self, advertisable_eid, report_date, end_date=None):
+        params = {
+            'advertisable': advertisable_eid,
+            'data_format': 'entity',
+            'start_date': datetime.datetime.strftime(report_date, "%m-%d-%Y"),
+            'end_date': datetime.datetime.strftime(end_date or report_date, "%m-%d-%Y"),
+        }
+        if self.report_window_days > 1:
+            params.update(DATE_BREAKDOWN_PARAMS)
+        return self.client.get_results(self.endpoint, params=params)
+
+    def stream_window(self, cell, observed):
+        # Streams the report of one advertisable for a window of days, adding
+        # its records and the time spent waiting on them to `observed`
+        window, advertisable_eid = cell
+        started_at = time.monotonic()
+        for rec in self.get_report(advertisable_eid, window[0], window[-1]):
+            observed[0] += 1
+            observed[1] += time.monotonic() - started_at
+            yield rec
+            started_at = time.monotonic()
+        observed[1] += time.monotonic() - started_at
+
+    def fetch_window(self, cell):
+        # Reads the report of one advertisable for a window of days, timed for sizing the next windows
+        window, advertisable_eid = cell
+        start = time.monotonic()
+        records = list(self.get_report(advertisable_eid, window[0], window[-1]))
+        return records, time.monotonic() - start
+
+    @staticmethod
+    def record_date(rec, window):
+        # Rows of a multi-day window carry their own day, a single day's rows are all for that day
+        if len(window) == 1:
+            report_date = window[0]
+        elif rec.get('date'):
+            report_date = utils.strptime_to_utc(rec['date'])
+        else:
+            raise Exception("Report row for advertisable {} has no date to split the window from {} to {} "
+                            "by".format(rec.get('eid'), utils.strftime(window[0]), utils.strftime(window[-1])))
+        return datetime.datetime.strftime(report_date, "%Y-%m-%dT00:00:00.000000Z")
+
+    def sync_partition(self, advertisable_eid, report_date, records):
+        partition = {'advertisable': advertisable_eid, 'date': utils.strftime(report_date)}
+        try:
+            for rec in records:
+                rec['date'] = datetime.datetime.strftime(report_date, "%Y-%m-%dT00:00:00.000000Z")
+                yield rec
+        except Exception as exc:  # pylint: disable=broad-except
+            if not is_partition_failure(exc):
+                raise
+            self.partition_failed(partition, exc)
+            return
+        self.partition_succeeded(partition)
+
+    def sync_window(self, advertisable_eid, window, records):
+        for rec in records:
+            rec['date'] = self.record_date(rec, window)
+            yield rec
+        for report_date in window:
+            self.partition_succeeded({'advertisable': advertisable_eid, 'date': utils.strftime(report_date)})
+
+    def window_failed(self, advertisable_eid, window, exc):
+        # Failed days are retried one by one by the next run
+        for report_date in window:
+            self.partition_failed({'advertisable': advertisable_eid, 'date': utils.strftime(report_date)}, exc)
+
+    def advertisable_bookmarks(self, advertisable_eids):
+        """Returns the last synced date of each advertisable, keyed by eid.
+
+        The single `date` bookmark of earlier versions is moved to every
+        advertisable known when migrating, and kept until there is one to
+        move it to. Advertisables added later have no bookmark and backfill
+        from the start date on their own.
+        """
+        bookmark = self.state.setdefault('bookmarks', {}).setdefault(self.stream_name, {})
+        bookmarks = bookmark.setdefault('advertisables', {})
+        if self.replication_keys[0] in bookmark and advertisable_eids:
+            shared_date = bookmark.pop(self.replication_keys[0])
+            for advertisable_eid in advertisable_eids:
+                bookmarks.setdefault(advertisable_eid, shared_date)
+        return bookmarks
+
+    def advertisable_report_dates(self, advertisable_eids):
+        # Each advertisable only fetches the days from its own bookmark on
+        bookmarks = self.advertisable_bookmarks(advertisable_eids)
+        return {advertisable_eid: list(self.generate_daily_date_windows(bookmarks.get(advertisable_eid)))
+                for advertisable_eid in advertisable_eids}
+
+    def write_advertisable_bookmark(self, advertisable_eid, report_date):
+        self.advertisable_bookmarks([])[advertisable_eid] = utils.strftime(report_date)
+
+    @staticmethod
+    def report_rounds(report_dates, sizer):
+        """Yields rounds of (window, advertisable_eid) cells, with the next window of each advertisable.
+
+        Advertisables that are backfilling keep getting windows after the
+        caught-up ones are done. Windows are cut as each round starts.
+        """
+        windows = {advertisable_eid: sizer.windows(dates) for advertisable_eid, dates in report_dates.items()}
+        while windows:
+            cells = []
+            for advertisable_eid, advertisable_windows in list(windows.items()):
+                window = next(advertisable_windows, None)
+                if window is None:
+                    del windows[advertisable_eid]
+                else:
+                    cells.append((window, advertisable_eid))
+            if cells:
+                yield cells
+
+    @staticmethod
+    def observe_window(sizer, window, result):
+        if result is None:
+            sizer.observe(len(window), 0, 0.0, failed=True)
+        else:
+            records, latency = result
+            sizer.observe(len(window), len(records), latency)
+
+    def retry_failed_partitions(self, first_dates):
+        # Days from the first date of each advertisable on are synced again anyway
+        for partition in list(self.failed_partitions()):
+            report_date = utils.strptime_to_utc(partition['date'])
+            first_date = first_dates.get(partition['advertisable'])
+            if first_date is not None and report_date >= first_date:
+                continue
+            self.client.deadline.check()
+            LOGGER.info("Retrying %s for advertisable %s for date %s", self.stream_id,
+                        partition['advertisable'], report_date)
+            yield from self.sync_partition(partition['advertisable'], report_date,
+                                           self.get_report(partition['advertisable'], report_date))
+        if self.failures_changed:
+            singer.write_state(self.state)
+
+    def sync_windows(self, report_dates):
+        """Fetches each advertisable's reports window by window, one request at a time.
+
+        Records are emitted as each response downloads, and the window is
+        sized by the time spent waiting on them. Each advertisable's bookmark
+        moves to the end of a window once it has been emitted, and the state
+        is written after each round.
+        """
+        sizer = ReportWindowSizer.from_config(self.config)
+        for cells in self.report_rounds(report_dates, sizer):
+            for window, advertisable_eid in cells:
+                self.client.deadline.check()
+                self.client.request_log.info("Syncing %s for advertisable %s for dates %s to %s", self.stream_id,
+                                             advertisable_eid, window[0], window[-1])
+                observed = [0, 0.0]
+                try:
+                    yield from self.sync_window(advertisable_eid, window,
+                                                self.stream_window((window, advertisable_eid), observed))
+                except Exception as exc:  # pylint: disable=broad-except
+                    if not is_partition_failure(exc):
+                        raise
+                    sizer.observe(len(window), 0, 0.0, failed=True)
+                    self.window_failed(advertisable_eid, window, exc)
+                else:
+                    sizer.observe(len(window), *observed)
+                # Failed days are retried next run
+                self.write_advertisable_bookmark(advertisable_eid, window[-1])
+            singer.write_state(self.state)
+
     def sync(self):
         advertisables = Advertisables(self.client, self.config, self.state)
-        # Daily Pagination writes a bookmark after each day
-        for report_date in self.generate_daily_date_windows():
-            request_date = datetime.datetime.strftime(report_date, "%m-%d-%Y")
-            for advertisable_eid in advertisables.get_all_advertisable_eids():
-                LOGGER.info("Syncing %s for advertisable %s for date %s", self.stream_id,
-                            advertisable_eid, report_date)
-                records = self.client.get(self.endpoint, params={
-                    'advertisable': advertisable_eid,
-                    'data_format': 'entity',
-                    'start_date': request_date,
-                    'end_date': request_date,
-                })
-                for rec in records.get('results'):
-                    rec['date'] = datetime.datetime.strftime(report_date, "%Y-%m-%dT00:00:00.000000Z")
-                    yield rec
+        report_dates = self.advertisable_report_dates(advertisables.get_all_advertisable_eids())
+        yield from self.retry_failed_partitions({advertisable_eid: dates[0]
+                                                 for advertisable_eid, dates in report_dates.items() if dates})
+        yield from self.sync_windows(report_dates)
+
+    async def sync_async(self):
+        """Fetches the reports of every (window, advertisable) cell concurrently.
+
+        Cells are started round by round, so only a few windows of each
+        advertisable are ever in flight. An advertisable's bookmark only
+        moves to a window once that window and every earlier one of the
+        advertisable has been fully emitted, and the state is written as
+        each round completes.
+        """
+        advertisables = Advertisables(self.client, self.config, self.state)
+        report_dates = self.advertisable_report_dates(await advertisables.get_all_advertisable_eids_async())
+        for rec in self.retry_failed_partitions({advertisable_eid: dates[0]
+                                                 for advertisable_eid, dates in report_dates.items() if dates}):
+            yield rec
 
-            # Write bookmark after syncing all Advertisables for the day
-            singer.bookmarks.write_bookmark(self.state, self.stream_name, self.replication_keys[0], utils.strftime(report_date))
-            singer.write_state(self.state)
+        sizer = ReportWindowSizer.from_config(self.config)
+        uncommitted = {}
+        completed = set()
+        # Cells of each round started and not yet done, oldest round first
+        rounds = deque()
+
+        def cells():
+            for round_cells in self.report_rounds(report_dates, sizer):
+                rounds.append(set(round_cells))
+                for window, advertisable_eid in round_cells:
+                    uncommitted.setdefault(advertisable_eid, deque()).append(window)
+                    yield window, advertisable_eid
+
+        def commit_completed_windows(advertisable_eid):
+            windows = uncommitted[advertisable_eid]
+            committed = None
+            while windows and (windows[0], advertisable_eid) in completed:
+                committed = windows.popleft()
+                completed.remove((committed, advertisable_eid))
+            if committed is not None:
+                self.write_advertisable_bookmark(advertisable_eid, committed[-1])
+
+        def finish_cell(cell):
+            for round_cells in rounds:
+                round_cells.discard(cell)
+            finished = False
+            while rounds and not rounds[0]:
+                rounds.popleft()
+                finished = True
+            if finished:
+                singer.write_state(self.state)
+
+        async for (window, advertisable_eid), (result, exc) in self.fan_out_async(
+                cells(), functools.partial(self.fetch_or_failure, self.fetch_window)):
+            self.observe_window(sizer, window, result)
+            if exc is not None:
+                self.window_failed(advertisable_eid, window, exc)
+            else:
+                for rec in self.sync_window(advertisable_eid, window, result[0]):
+                    yield rec
+            completed.add((window, advertisable_eid))
+            commit_completed_windows(advertisable_eid)
+            finish_cell((window, advertisable_eid))
 
 
 class Segments(Stream):
@@ -123,13 +528,11 @@ class Segments(Stream):
 
 
     def sync(self):
-        advertisables = Advertisables(self.client, self.config, self.state)
-        for advertisable_eid in advertisables.get_all_advertisable_eids():
-            records = self.client.get(self.endpoint, params={
-                'advertisable': advertisable_eid
-            })
-            for rec in records.get('results'):
-                yield rec
+        yield from self.sync_per_advertisable()
+
+    async def sync_async(self):
+        async for rec in self.sync_per_advertisable_async():
+            yield rec
 
 class Campaigns(Stream):
     stream_id = 'campaigns'
@@ -143,13 +546,11 @@ class Campaigns(Stream):
 
     def sync(self):
         # TODO: Can switch on `is_active` by default "True" returning only active campaigns
-        advertisables = Advertisables(self.client, self.config, self.state)
-        for advertisable_eid in advertisables.get_all_advertisable_eids():
-            records = self.client.get(self.endpoint, params={
-                'advertisable': advertisable_eid
-            })
-            for rec in records.get('results'):
-                yield rec
+        yield from self.sync_per_advertisable()
+
+    async def sync_async(self):
+        async for rec in self.sync_per_advertisable_async():
+            yield rec
 
 
 class AdGroups(Stream):
@@ -164,13 +565,11 @@ class AdGroups(Stream):
 
     def sync(self):
         # TODO: Can switch on `camp_active` by default "True" returning only for active campaigns
-        advertisables = Advertisables(self.client, self.config, self.state)
-        for advertisable_eid in advertisables.get_all_advertisable_eids():
-            records = self.client.get(self.endpoint, params={
-                'advertisable': advertisable_eid
-            })
-            for rec in records.get('results'):
-                yield rec
+        yield from self.sync_per_advertisable()
+
+    async def sync_async(self):
+        async for rec in self.sync_per_advertisable_async():
+            yield rec
 
 
 STREAM_OBJECTS = {
@@ -1,36 +1,70 @@
 import singer
 from singer import Transformer, metadata
 
-from .streams import STREAM_OBJECTS
+from .client import get_config_bool
+from .deadline import SyncDeadlineReached
+from .streams import STREAM_OBJECTS, iterate_async
 
 LOGGER = singer.get_logger()
 
 
+def sync_stream(client, config, state, stream):
+    stream_id = stream.tap_stream_id
+    stream_schema = stream.schema
+    stream_object = STREAM_OBJECTS.get(stream_id)(client, config, state)
+
+    if stream_object is None:
+        raise Exception("Attempted to sync unknown stream {}".format(stream_id))
+
+    singer.write_schema(
+        stream_id,
+        stream_schema.to_dict(),
+        stream_object.key_properties,
+        stream_object.replication_keys,
+    )
+
+    LOGGER.info("Syncing stream: %s", stream_id)
+
+    if get_config_bool(config, 'use_asyncio'):
+        records = iterate_async(stream_object.sync_async(), stream_object.async_concurrency)
+    else:
+        records = stream_object.sync()
+
+    with Transformer() as transformer:
+        for rec in records:
+            singer.write_record(
+                stream_id,
+                transformer.transform(rec,
+                                      stream.schema.to_dict(),
+                                      metadata.to_map(stream.metadata))
+            )
+
+    client.http_metrics.log_histograms(stream_id)
+    return stream_object.failed
+
+
 def do_sync(client, config, state, catalog):
     selected_streams = catalog.get_selected_streams(state)
 
-    for stream in selected_streams:
-        stream_id = stream.tap_stream_id
-        stream_schema = stream.schema
-        stream_object = STREAM_OBJECTS.get(stream_id)(client, config, state)
-
-        if stream_object is None:
-            raise Exception("Attempted to sync unknown stream {}".format(stream_id))
-
-        singer.write_schema(
-            stream_id,
-            stream_schema.to_dict(),
-            stream_object.key_properties,
-            stream_object.replication_keys,
-        )
-
-        LOGGER.info("Syncing stream: %s", stream_id)
-
-        with Transformer() as transformer:
-            for rec in stream_object.sync():
-                singer.write_record(
-                    stream_id,
-                    transformer.transform(rec,
-                                          stream.schema.to_dict(),
-                                          metadata.to_map(stream.metadata))
-                )
+    # Streams go on past partitions the API fails to serve, the run only
+    # fails once every stream had its turn
+    failed_streams = {}
+    try:
+        for stream in selected_streams:
+            failed = sync_stream(client, config, state, stream)
+            if failed:
+                failed_streams[stream.tap_stream_id] = len(failed)
+    except SyncDeadlineReached as exc:
+        # Bookmarks only ever cover fully emitted partitions, so the state as
+        # it stands is safe for the next run to resume from
+        LOGGER.warning("%s, stopping the sync early", exc)
+        singer.write_state(state)
+
+    client.log_summary()
+
+    if failed_streams:
+        raise Exception("Failed to sync {}, the failed partitions are recorded in the state to retry. "
+                        "Circuits open for endpoints: {}".format(
+                            ', '.join('{} partitions of {}'.format(count, stream_id)
+                                      for stream_id, count in failed_streams.items()),
+                            ', '.join(client.circuit_breaker.open_endpoints()) or 'none'))
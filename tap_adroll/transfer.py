@@ -0,0 +1,60 @@
+import threading
+from importlib import metadata
+
+import singer
+from singer import metrics
+from urllib3.util import make_headers
+
+LOGGER = singer.get_logger()
+
+
+def tap_version():
+    try:
+        return metadata.version('tap-adroll')
+    except metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+def default_headers(config, compression=True):
+    # urllib3 only offers the encodings it can decode, which includes br
+    # when brotli is installed
+    if compression:
+        accept_encoding = make_headers(accept_encoding=True)['accept-encoding'].replace(',', ', ')
+    else:
+        accept_encoding = 'identity'
+    return {
+        'User-Agent': config.get('user_agent') or 'tap-adroll/{}'.format(tap_version()),
+        'Accept-Encoding': accept_encoding,
+    }
+
+
+def wire_bytes(response, decoded_bytes):
+    # Bytes read off the socket before decompression, when they can be told
+    raw = getattr(response, 'raw', None)
+    if raw is not None and hasattr(raw, 'tell'):
+        return raw.tell()
+    return int(response.headers.get('Content-Length') or decoded_bytes)
+
+
+class TransferStats():
+    """Counts, per endpoint, the bytes transferred and what they decompressed to."""
+
+    def __init__(self):
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, wire, decoded):
+        with self.lock:
+            stats = self.stats.setdefault(endpoint, {'wire_bytes': 0, 'decoded_bytes': 0})
+            stats['wire_bytes'] += wire
+            stats['decoded_bytes'] += decoded
+
+    def log_summary(self):
+        for endpoint, stats in sorted(self.stats.items()):
+            for metric in ('wire_bytes', 'decoded_bytes'):
+                metrics.log(LOGGER, metrics.Point('counter', metric, stats[metric],
+                                                  {metrics.Tag.endpoint: endpoint}))
+            if stats['decoded_bytes']:
+                LOGGER.info("Endpoint %s transferred %s bytes for %s bytes of responses (%.0f%%)",
+                            endpoint, stats['wire_bytes'], stats['decoded_bytes'],
+                            100.0 * stats['wire_bytes'] / stats['decoded_bytes'])
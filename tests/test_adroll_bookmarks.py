@@ -97,15 +97,16 @@ class TestAdrollIncrementalReplication(TestAdrollBase):
 
         first_sync_state = menagerie.get_state(conn_id)
 
-        # Verify the state against the end_date
+        # Verify the state against the end_date, ad_reports keeps a bookmark per advertisable
         for stream in incremental_streams:
-            replication_key = next(iter(self.expected_metadata().get(stream).get(self.REPLICATION_KEYS)))
-            d1 = first_sync_state.get('bookmarks').get(stream).get(replication_key)
-            d2 = self.END_DATE
-            self.assertEqual(self.parse_date(d1), self.parse_date(d2),
-                             msg="Bookmark does not obey end_date.\n" +
-                             "Bookmark: {}\n".format(d1) +
-                             "End Date: {}\n".format(d2))
+            advertisable_bookmarks = first_sync_state.get('bookmarks').get(stream).get('advertisables')
+            self.assertTrue(advertisable_bookmarks, msg="No advertisable bookmarks for {}".format(stream))
+            for advertisable_eid, d1 in advertisable_bookmarks.items():
+                d2 = self.END_DATE
+                self.assertEqual(self.parse_date(d1), self.parse_date(d2),
+                                 msg="Bookmark of advertisable {} does not obey end_date.\n".format(advertisable_eid) +
+                                 "Bookmark: {}\n".format(d1) +
+                                 "End Date: {}\n".format(d2))
 
         # Get the set of records from a first sync
         first_sync_records = runner.get_records_from_target_output()
@@ -141,13 +142,13 @@ class TestAdrollIncrementalReplication(TestAdrollBase):
                 second_data = [record.get("data", {}).get("date") for record
                                in second_sync_records.get(stream, {}).get("messages", {"data": {}})]
 
-                replication_key = next(iter(self.expected_metadata().get(stream).get(self.REPLICATION_KEYS)))
-                first_sync_bookmark = first_sync_state.get('bookmarks').get(stream).get(replication_key)
+                first_sync_bookmarks = {
+                    self.parse_date(bookmark)
+                    for bookmark in first_sync_state.get('bookmarks').get(stream).get('advertisables').values()}
                 for date_value in second_data:
                     
-                    self.assertEqual(self.parse_date(first_sync_bookmark),
-                                     self.parse_date(date_value),
-                                     msg="First sync bookmark does not equal 2nd sync record's replication-key")
+                    self.assertIn(self.parse_date(date_value), first_sync_bookmarks,
+                                  msg="No first sync advertisable bookmark equals 2nd sync record's replication-key")
 
 
 if __name__ == '__main__':
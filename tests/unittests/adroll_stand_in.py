@@ -0,0 +1,173 @@
+"""A local stand-in for the AdRoll API, and the helpers shared by the unit tests."""
+
+import json
+import os
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+from singer import metadata
+
+# The stand-in serves plain http, which OAuth2Session refuses by default
+os.environ.setdefault("OAUTHLIB_INSECURE_TRANSPORT", "1")
+
+API_PREFIX = "/api/v1/"
+
+# The credentials every test client is created with
+CLIENT_CONFIG = {
+    "access_token": "sample_access_token",
+    "refresh_token": "sample_refresh_token",
+    "client_id": "sample_client_id",
+    "client_secret": "sample_client_secret",
+}
+ADVERTISABLE_EIDS = ["ADV{}".format(i) for i in range(20)]
+
+
+def advertisables_route(eids=ADVERTISABLE_EIDS):
+    return lambda params, headers: {"results": [{"eid": eid} for eid in eids]}
+
+
+def select_streams(catalog, stream_ids):
+    for stream in catalog.streams:
+        if stream.tap_stream_id in stream_ids:
+            mdata = metadata.to_map(stream.metadata)
+            mdata = metadata.write(mdata, (), "selected", True)
+            stream.metadata = metadata.to_list(mdata)
+    return catalog
+
+
+def logged_metric_points(mock_logger):
+    return [json.loads(call[0][1]) for call in mock_logger.info.call_args_list if call[0][0] == "METRIC: %s"]
+
+
+class FakeClock:
+    """A clock that only advances when a test moves `now` or something sleeps on it."""
+
+    def __init__(self, now=0.0):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class InFlightRoute:
+    """Sleeps per request and tracks the highest number of concurrent requests."""
+
+    def __init__(self, body_for, delay=0.05):
+        self.body_for = body_for
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, params, headers):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        return self.body_for(params)
+
+
+class StandInServer:
+    """Serves registered routes on 127.0.0.1 and records every request.
+
+    A route is a callable taking ``(params, headers)`` and returning either a
+    JSON-serializable body, or a ``(status, headers, body)`` tuple.
+    """
+
+    def __init__(self, routes=None):
+        self.routes = dict(routes or {})
+        self.routes.setdefault("organization/get", lambda params, headers: {"results": {"eid": "ORG"}})
+        self.requests = []
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return "http://127.0.0.1:{}{}".format(self._server.server_address[1], API_PREFIX)
+
+    @property
+    def token_url(self):
+        return "http://127.0.0.1:{}/auth/token".format(self._server.server_address[1])
+
+    def requests_to(self, endpoint):
+        return [params for path, params in self.requests if path == endpoint]
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _make_handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # Headers and body are written separately, don't let Nagle delay the body
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with stand_in._lock:
+                    stand_in.connections += 1
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                self.respond(url.path, dict(parse_qsl(url.query)))
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length).decode("utf-8")
+                self.respond(url.path, dict(parse_qsl(body)))
+
+            def respond(self, path, params):
+                if path.startswith(API_PREFIX):
+                    endpoint = path[len(API_PREFIX):]
+                else:
+                    endpoint = path.lstrip("/")
+                with stand_in._lock:
+                    stand_in.requests.append((endpoint, params))
+
+                route = stand_in.routes.get(endpoint)
+                if route is None:
+                    status, headers, body = 404, {}, {"message": "Not found"}
+                else:
+                    result = route(params, self.headers)
+                    if isinstance(result, tuple):
+                        status, headers, body = result
+                    else:
+                        status, headers, body = 200, {}, result
+
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                if status == 304:
+                    self.end_headers()
+                    return
+
+                payload = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                pass
+
+        return Handler
@@ -0,0 +1,87 @@
+import unittest
+from unittest.mock import patch
+
+from tap_adroll.client import AdrollClient
+from tap_adroll.streams import AdReports, iterate_async
+
+from adroll_stand_in import CLIENT_CONFIG, StandInServer
+
+
+class TestAdReportsBookmarks(unittest.TestCase):
+
+    """Test the ad_reports bookmark kept for each advertisable."""
+
+    def setUp(self):
+        self.config = {
+            **CLIENT_CONFIG,
+            "start_date": "2020-01-01T00:00:00Z",
+            "end_date": "2020-01-10T00:00:00Z",
+        }
+        self.routes = {
+            "organization/get_advertisables": lambda params, headers: {"results": [{"eid": "ADV0"}, {"eid": "ADV1"}]},
+            "report/ad": lambda params, headers: {"results": [{"eid": "report-" + params["advertisable"]}]},
+        }
+
+    @patch("singer.write_state")
+    def sync_reports(self, config, state, mock_write_state):
+        with StandInServer(self.routes) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url):
+                client = AdrollClient("/dev/null", config, True)
+                stream = AdReports(client, config, state)
+                if config.get("use_asyncio"):
+                    records = list(iterate_async(stream.sync_async(), stream.async_concurrency))
+                else:
+                    records = list(stream.sync())
+        return [(params["advertisable"], params["start_date"]) for params in stand_in.requests_to("report/ad")], records
+
+    def test_shared_date_bookmark_is_migrated(self):
+        """The single date bookmark of earlier versions becomes the bookmark of every known advertisable."""
+
+        state = {"bookmarks": {"ad_reports": {"date": "2020-01-08T00:00:00.000000Z"}}}
+        requests, records = self.sync_reports(self.config, state)
+
+        self.assertCountEqual(requests, [(eid, "01-{:02}-2020".format(day)) for eid in ("ADV0", "ADV1")
+                                         for day in (8, 9, 10)])
+        self.assertEqual(len(records), 6)
+        self.assertEqual(state["bookmarks"]["ad_reports"], {"advertisables": {
+            "ADV0": "2020-01-10T00:00:00.000000Z",
+            "ADV1": "2020-01-10T00:00:00.000000Z",
+        }})
+
+    def test_shared_date_bookmark_is_kept_without_advertisables(self):
+        """The date bookmark of earlier versions is left in place while there is no advertisable to move it to."""
+
+        self.routes["organization/get_advertisables"] = lambda params, headers: {"results": []}
+        state = {"bookmarks": {"ad_reports": {"date": "2020-01-08T00:00:00.000000Z"}}}
+        requests, records = self.sync_reports(self.config, state)
+
+        self.assertEqual((requests, records), ([], []))
+        self.assertEqual(state["bookmarks"]["ad_reports"], {"date": "2020-01-08T00:00:00.000000Z", "advertisables": {}})
+
+    def test_new_advertisable_backfills_on_its_own(self):
+        """An advertisable without a bookmark syncs from the start date while the others only sync their missing days."""
+
+        state = {"bookmarks": {"ad_reports": {"advertisables": {"ADV0": "2020-01-08T00:00:00.000000Z"}}}}
+        requests, _ = self.sync_reports(self.config, state)
+
+        self.assertCountEqual(requests, [("ADV0", "01-{:02}-2020".format(day)) for day in (8, 9, 10)]
+                              + [("ADV1", "01-{:02}-2020".format(day)) for day in range(1, 11)])
+        # Windows are taken in turns, so the caught up advertisable does not wait for the backfill
+        self.assertEqual(sum(1 for eid, _ in requests[:6] if eid == "ADV0"), 3)
+        self.assertEqual(state["bookmarks"]["ad_reports"]["advertisables"], {
+            "ADV0": "2020-01-10T00:00:00.000000Z",
+            "ADV1": "2020-01-10T00:00:00.000000Z",
+        })
+
+    def test_new_advertisable_backfills_concurrently(self):
+        """With use_asyncio the backfill runs alongside the other advertisables."""
+
+        state = {"bookmarks": {"ad_reports": {"advertisables": {"ADV0": "2020-01-08T00:00:00.000000Z"}}}}
+        requests, records = self.sync_reports({**self.config, "use_asyncio": True, "async_concurrency": 2}, state)
+
+        self.assertEqual(len(requests), 13)
+        self.assertEqual(len(records), 13)
+        self.assertEqual(state["bookmarks"]["ad_reports"]["advertisables"], {
+            "ADV0": "2020-01-10T00:00:00.000000Z",
+            "ADV1": "2020-01-10T00:00:00.000000Z",
+        })
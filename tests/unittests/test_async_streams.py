@@ -0,0 +1,75 @@
+import unittest
+from unittest.mock import patch
+
+from tap_adroll.client import AdrollClient
+from tap_adroll.streams import Ads, AdReports, iterate_async
+
+from adroll_stand_in import ADVERTISABLE_EIDS, CLIENT_CONFIG, InFlightRoute, StandInServer, advertisables_route
+
+
+class TestAsyncStreams(unittest.TestCase):
+
+    """Test the asyncio stream generators against a local stand-in."""
+
+    def setUp(self):
+        self.config = {
+            **CLIENT_CONFIG,
+            "start_date": "2020-01-01T00:00:00Z",
+            "end_date": "2020-01-02T00:00:00Z",
+            "async_concurrency": 5,
+        }
+        self.ads_route = InFlightRoute(
+            lambda params: {"results": [{"eid": "ad-" + params["advertisable"]}]})
+        self.reports_route = InFlightRoute(
+            lambda params: {"results": [{"eid": "report-" + params["advertisable"]}]})
+        self.routes = {
+            "organization/get_advertisables": advertisables_route(),
+            "advertisable/get_ads": self.ads_route,
+            "report/ad": self.reports_route,
+        }
+
+    def test_async_sync_matches_sync_with_capped_concurrency(self):
+        """The async generator yields the same records as sync() with bounded concurrency."""
+
+        with StandInServer(self.routes) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url):
+                client = AdrollClient("/dev/null", self.config, True)
+                expected = list(Ads(client, self.config, {}).sync())
+                self.assertEqual(self.ads_route.max_in_flight, 1)
+
+                stream = Ads(client, self.config, {})
+                actual = list(iterate_async(stream.sync_async(), stream.async_concurrency))
+
+        self.assertCountEqual(actual, expected)
+        self.assertEqual(len(actual), len(ADVERTISABLE_EIDS))
+        self.assertGreater(self.ads_route.max_in_flight, 1)
+        self.assertLessEqual(self.ads_route.max_in_flight, 5)
+
+    @patch("tap_adroll.streams.singer.write_state")
+    def test_async_ad_reports_bookmark_per_day(self, mock_write_state):
+        """Bookmarks move as each advertisable's day is emitted, and the state is written once per day."""
+
+        state = {}
+        with StandInServer(self.routes) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url):
+                client = AdrollClient("/dev/null", self.config, True)
+                stream = AdReports(client, self.config, state)
+                records = list(iterate_async(stream.sync_async(), stream.async_concurrency))
+
+        self.assertEqual(len(records), 2 * len(ADVERTISABLE_EIDS))
+        self.assertEqual(mock_write_state.call_count, 2)
+        self.assertEqual(state["bookmarks"]["ad_reports"]["advertisables"],
+                         {eid: "2020-01-02T00:00:00.000000Z" for eid in ADVERTISABLE_EIDS})
+
+    def test_early_exit_cleans_up_event_loop(self):
+        """Closing the sync adapter early cancels outstanding work without errors."""
+
+        with StandInServer(self.routes) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url):
+                client = AdrollClient("/dev/null", self.config, True)
+                stream = Ads(client, self.config, {})
+                records = iterate_async(stream.sync_async(), stream.async_concurrency)
+                first = next(records)
+                records.close()
+
+        self.assertTrue(first["eid"].startswith("ad-"))
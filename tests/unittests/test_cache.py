@@ -0,0 +1,112 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from tap_adroll.cache import ResponseCache
+from tap_adroll.client import AdrollClient
+from tap_adroll.streams import Campaigns
+
+from adroll_stand_in import CLIENT_CONFIG, FakeClock, StandInServer
+
+
+class TestResponseCache(unittest.TestCase):
+
+    """Test the persistent response cache."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmp_dir.name, "cache")
+        self.config = {
+            **CLIENT_CONFIG,
+            "start_date": "2020-01-01T00:00:00Z",
+            "cache_dir": self.cache_dir,
+        }
+        self.routes = {
+            "organization/get_advertisables": lambda params, headers: {
+                "results": [{"eid": "ADV1"}, {"eid": "ADV2"}]},
+            "advertisable/get_campaigns": lambda params, headers: {
+                "results": [{"eid": "campaign-" + params["advertisable"]}]},
+            "report/ad": lambda params, headers: {"results": []},
+        }
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_campaigns(self, stand_in, config):
+        with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url):
+            client = AdrollClient("/dev/null", config, True)
+            records = list(Campaigns(client, config, {}).sync())
+            client.get("report/ad", params={"advertisable": "ADV1"})
+        return records
+
+    def test_back_to_back_runs_reuse_responses(self):
+        """A second run serves dimension endpoints from the cache but still fetches reports."""
+
+        with StandInServer(self.routes) as stand_in:
+            first = self.run_campaigns(stand_in, self.config)
+            second = self.run_campaigns(stand_in, self.config)
+
+            self.assertEqual(first, second)
+            self.assertEqual(len(stand_in.requests_to("organization/get_advertisables")), 1)
+            self.assertEqual(len(stand_in.requests_to("advertisable/get_campaigns")), 2)
+            self.assertEqual(len(stand_in.requests_to("report/ad")), 2)
+
+    def test_accounts_do_not_share_entries(self):
+        """Configs with different client ids sharing a cache_dir each fetch their own responses."""
+
+        with StandInServer(self.routes) as stand_in:
+            self.run_campaigns(stand_in, self.config)
+            stand_in.routes["organization/get_advertisables"] = lambda params, headers: {"results": [{"eid": "ADV3"}]}
+            other = self.run_campaigns(stand_in, {**self.config, "client_id": "other_client_id"})
+
+            self.assertEqual(other, [{"eid": "campaign-ADV3"}])
+            self.assertEqual(len(stand_in.requests_to("organization/get_advertisables")), 2)
+
+    def test_bypass_refetches_and_refreshes(self):
+        """With cache_bypass the cache is not read, but fresh responses are still stored."""
+
+        with StandInServer(self.routes) as stand_in:
+            self.run_campaigns(stand_in, self.config)
+            self.run_campaigns(stand_in, {**self.config, "cache_bypass": True})
+            self.run_campaigns(stand_in, self.config)
+
+            self.assertEqual(len(stand_in.requests_to("advertisable/get_campaigns")), 4)
+
+    def test_entries_expire_after_ttl(self):
+        """Entries older than their endpoint's TTL are misses and are removed."""
+
+        clock = FakeClock(1600000000.0)
+        cache = ResponseCache(self.cache_dir, ttls={"advertisable/get_ads": 60}, clock=clock)
+        cache.put("advertisable/get_ads", {"advertisable": "ADV1"}, b'{"results": []}')
+
+        clock.now += 59
+        self.assertEqual(cache.get("advertisable/get_ads", {"advertisable": "ADV1"}), b'{"results": []}')
+        clock.now += 2
+        self.assertIsNone(cache.get("advertisable/get_ads", {"advertisable": "ADV1"}))
+        self.assertEqual(os.listdir(self.cache_dir), [])
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_endpoints_without_ttl_are_not_cached(self):
+        """Only endpoints with a TTL are stored."""
+
+        cache = ResponseCache(self.cache_dir, ttls={"advertisable/get_ads": 60})
+        cache.put("report/ad", {}, b"{}")
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_least_recently_used_entries_are_evicted(self):
+        """Once over max_bytes, the least recently used entries are evicted first."""
+
+        clock = FakeClock(1600000000.0)
+        cache = ResponseCache(self.cache_dir, ttls={"x": 3600}, max_bytes=250, clock=clock)
+        for name in ("a", "b"):
+            cache.put("x", {"id": name}, b"." * 100)
+            clock.now += 1
+        # Using "a" makes "b" the least recently used entry
+        self.assertIsNotNone(cache.get("x", {"id": "a"}))
+        clock.now += 1
+        cache.put("x", {"id": "c"}, b"." * 100)
+
+        self.assertIsNotNone(cache.get("x", {"id": "a"}))
+        self.assertIsNone(cache.get("x", {"id": "b"}))
+        self.assertIsNotNone(cache.get("x", {"id": "c"}))
@@ -0,0 +1,119 @@
+import unittest
+from unittest.mock import patch
+
+from tap_adroll.circuit_breaker import CircuitBreaker, CircuitOpenError
+from tap_adroll.client import AdrollClient
+from tap_adroll.discover import do_discover
+from tap_adroll.sync import do_sync
+
+from adroll_stand_in import CLIENT_CONFIG, FakeClock, StandInServer, advertisables_route, select_streams
+
+ADVERTISABLE_EIDS = ["ADV{}".format(i) for i in range(10)]
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    """Test skipping endpoints that keep failing while other streams carry on."""
+
+    def setUp(self):
+        self.config = {
+            **CLIENT_CONFIG,
+            "start_date": "2020-01-01T00:00:00Z",
+            "end_date": "2020-01-02T00:00:00Z",
+            "max_tries": 2,
+        }
+        self.routes = {
+            "organization/get_advertisables": advertisables_route(ADVERTISABLE_EIDS),
+            "advertisable/get_segments": lambda params, headers: (503, {}, {"message": "unavailable"}),
+            "advertisable/get_ads": lambda params, headers: {"results": [{"eid": "ad-" + params["advertisable"]}]},
+        }
+
+    def run_sync(self, stream_ids, state, routes=None):
+        catalog = select_streams(do_discover(), stream_ids)
+        with StandInServer(routes or self.routes) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url):
+                client = AdrollClient("/dev/null", self.config, True)
+                try:
+                    do_sync(client, self.config, state, catalog)
+                    error = None
+                except Exception as exc:  # pylint: disable=broad-except
+                    error = exc
+        return stand_in, error
+
+    @patch("time.sleep")
+    @patch("singer.write_record")
+    @patch("singer.write_state")
+    def test_failing_endpoint_is_skipped(self, mock_write_state, mock_write_record, mock_sleep):
+        """Once get_segments keeps failing it is no longer called, ads still syncs and the run fails at the end."""
+
+        state = {}
+        stand_in, error = self.run_sync(["segments", "ads"], state)
+
+        # Five advertisables, each tried twice, open the circuit for the other five
+        self.assertEqual(len(stand_in.requests_to("advertisable/get_segments")), 10)
+        self.assertEqual(len(stand_in.requests_to("advertisable/get_ads")), 10)
+        ads = [call[0][1] for call in mock_write_record.call_args_list if call[0][0] == "ads"]
+        self.assertEqual(len(ads), 10)
+
+        self.assertEqual(state["bookmarks"]["segments"]["failed_partitions"],
+                         [{"advertisable": eid} for eid in ADVERTISABLE_EIDS])
+        self.assertNotIn("ads", state.get("bookmarks", {}))
+        mock_write_state.assert_called_with(state)
+        self.assertIn("10 partitions of segments", str(error))
+        self.assertIn("advertisable/get_segments", str(error))
+
+    @patch("time.sleep")
+    @patch("singer.write_record")
+    @patch("singer.write_state")
+    def test_failed_report_days_are_retried_next_run(self, mock_write_state, mock_write_record, mock_sleep):
+        """A report that failed is recorded, retried by the next run, then cleared from the state."""
+
+        failing = {"ADV1"}
+
+        def report(params, headers):
+            if params["advertisable"] in failing:
+                return 500, {}, {"message": "error"}
+            return {"results": [{"eid": "report-" + params["advertisable"]}]}
+
+        routes = {
+            "organization/get_advertisables": lambda params, headers: {"results": [{"eid": "ADV0"}, {"eid": "ADV1"}]},
+            "report/ad": report,
+        }
+        state = {}
+        _, error = self.run_sync(["ad_reports"], state, routes)
+        self.assertIsNotNone(error)
+        self.assertEqual(state["bookmarks"]["ad_reports"]["advertisables"],
+                         {"ADV0": "2020-01-02T00:00:00.000000Z", "ADV1": "2020-01-02T00:00:00.000000Z"})
+        self.assertEqual(state["bookmarks"]["ad_reports"]["failed_partitions"], [
+            {"advertisable": "ADV1", "date": "2020-01-01T00:00:00.000000Z"},
+            {"advertisable": "ADV1", "date": "2020-01-02T00:00:00.000000Z"},
+        ])
+
+        failing.clear()
+        mock_write_record.reset_mock()
+        stand_in, error = self.run_sync(["ad_reports"], state, routes)
+
+        self.assertIsNone(error)
+        self.assertNotIn("failed_partitions", state["bookmarks"]["ad_reports"])
+        # The failed first day is retried, the second is synced again from the bookmark
+        self.assertEqual(sorted((params["advertisable"], params["start_date"]) for params in stand_in.requests_to("report/ad")),
+                         [("ADV0", "01-02-2020"), ("ADV1", "01-01-2020"), ("ADV1", "01-02-2020")])
+
+    def test_opens_at_failure_rate_and_resets(self):
+        """The circuit opens once enough recent requests failed, and closes again after reset_seconds."""
+
+        clock = FakeClock(1000.0)
+        breaker = CircuitBreaker(failure_rate=0.5, min_requests=4, window=4, reset_seconds=60, clock=clock)
+        for failed in (False, True, False):
+            breaker.record("report/ad", failed)
+        breaker.check("report/ad")
+        breaker.record("report/ad", True)
+
+        with self.assertRaises(CircuitOpenError):
+            breaker.check("report/ad")
+        breaker.check("advertisable/get_ads")
+        self.assertEqual(breaker.open_endpoints(), ["report/ad"])
+
+        clock.now += 60
+        breaker.check("report/ad")
+        self.assertEqual(breaker.open_endpoints(), [])
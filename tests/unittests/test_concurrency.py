@@ -0,0 +1,169 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+from requests.exceptions import HTTPError
+
+from tap_adroll.client import AdrollClient
+from tap_adroll.concurrency import AdaptiveConcurrencyLimiter
+
+from adroll_stand_in import CLIENT_CONFIG, FakeClock, StandInServer, logged_metric_points
+
+
+class ThrottlingRoute:
+    """Answers 429 whenever more than `capacity` requests are in flight."""
+
+    def __init__(self, capacity, delay=0.02):
+        self.capacity = capacity
+        self.delay = delay
+        self.in_flight = 0
+        self.throttled = 0
+        self.served = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, params, headers):
+        with self.lock:
+            self.in_flight += 1
+            over_capacity = self.in_flight > self.capacity
+            if over_capacity:
+                self.throttled += 1
+        try:
+            if over_capacity:
+                return 429, {"Retry-After": "0"}, {"message": "Too many requests"}
+            # Not time.sleep, which the tests patch out for the client
+            threading.Event().wait(self.delay)
+            with self.lock:
+                self.served += 1
+            return {"results": []}
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+class TestAdaptiveConcurrency(unittest.TestCase):
+
+    """Test the AIMD concurrency controller."""
+
+    def setUp(self):
+        self.config = dict(CLIENT_CONFIG)
+
+    @patch("tap_adroll.concurrency.LOGGER")
+    def test_additive_increase_multiplicative_decrease(self, mock_logger):
+        """The window grows by one per window of healthy responses and halves on failure, counting each change."""
+
+        clock = FakeClock()
+        limiter = AdaptiveConcurrencyLimiter(initial=4, maximum=10, clock=clock)
+        for _ in range(4):
+            limiter.release(limiter.acquire(), healthy=True)
+        self.assertEqual(limiter.limit, 4)
+        limiter.release(limiter.acquire(), healthy=True)
+        self.assertEqual(limiter.limit, 5)
+
+        limiter.release(limiter.acquire(), healthy=False)
+        self.assertEqual(limiter.limit, 2)
+
+        points = logged_metric_points(mock_logger)
+        self.assertEqual([(point["type"], point["metric"], point["value"], point["tags"]) for point in points], [
+            ("counter", "concurrency_window_changes", 1, {"limit": 5, "previous_limit": 4, "direction": "increase"}),
+            ("counter", "concurrency_window_changes", 1, {"limit": 2, "previous_limit": 5, "direction": "decrease"}),
+        ])
+
+    def test_one_decrease_per_window(self):
+        """Failures of requests started before the last decrease do not shrink it again."""
+
+        clock = FakeClock()
+        limiter = AdaptiveConcurrencyLimiter(initial=8, clock=clock)
+        started = [limiter.acquire() for _ in range(4)]
+        clock.now = 1.0
+        for started_at in started:
+            limiter.release(started_at, healthy=False)
+
+        self.assertEqual(limiter.limit, 4)
+
+    def test_latency_spike_decreases(self):
+        """A response much slower than the baseline latency halves the window."""
+
+        clock = FakeClock()
+        limiter = AdaptiveConcurrencyLimiter(initial=8, latency_tolerance=3, clock=clock)
+        for _ in range(8):
+            started_at = limiter.acquire()
+            clock.now += 0.1
+            limiter.release(started_at)
+        self.assertEqual(limiter.limit, 8)
+
+        started_at = limiter.acquire()
+        clock.now += 1.0
+        limiter.release(started_at)
+        self.assertEqual(limiter.limit, 4)
+
+    def test_baseline_is_kept_per_endpoint(self):
+        """A slow endpoint is not a spike against a fast one, and time before sending is not latency."""
+
+        clock = FakeClock()
+        limiter = AdaptiveConcurrencyLimiter(initial=8, latency_tolerance=3, clock=clock)
+        for endpoint, latency in [("organization/get_advertisables", 0.1)] + [("report/ad", 2.0)] * 4:
+            started_at = limiter.acquire()
+            clock.now += latency
+            limiter.release(started_at, endpoint=endpoint)
+        self.assertEqual(limiter.limit, 8)
+
+        # A token refresh before sending does not make the request a spike
+        started_at = limiter.acquire()
+        clock.now += 10.0
+        sent_at = clock()
+        clock.now += 2.0
+        limiter.release(started_at, endpoint="report/ad", sent_at=sent_at)
+        self.assertEqual(limiter.limit, 8)
+
+        started_at = limiter.acquire()
+        clock.now += 10.0
+        limiter.release(started_at, endpoint="report/ad")
+        self.assertEqual(limiter.limit, 4)
+
+    def run_workers(self, route, config, threads=16, requests_per_thread=15):
+        with StandInServer({"report/ad": route}) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url), patch("time.sleep"):
+                client = AdrollClient("/dev/null", config, True)
+
+                def worker():
+                    for _ in range(requests_per_thread):
+                        try:
+                            client.get("report/ad")
+                        except HTTPError:
+                            pass
+
+                workers = [threading.Thread(target=worker) for _ in range(threads)]
+                for thread in workers:
+                    thread.start()
+                for thread in workers:
+                    thread.join()
+        return client
+
+    def test_window_shrinks_under_injected_throttling(self):
+        """Against a stand-in that throttles above 3 in-flight requests, the first 429 halves the window."""
+
+        limits = []
+        release = AdaptiveConcurrencyLimiter.release
+
+        def recording_release(limiter, started_at, healthy=True, **kwargs):
+            release(limiter, started_at, healthy, **kwargs)
+            if not healthy:
+                limits.append(limiter.limit)
+
+        route = ThrottlingRoute(capacity=3)
+        with patch.object(AdaptiveConcurrencyLimiter, "release", recording_release):
+            self.run_workers(route, {**self.config, "initial_concurrency": 12, "max_concurrency": 32})
+
+        self.assertGreater(route.throttled, 0)
+        # Throttled responses come back before any healthy one could grow the window past 13
+        self.assertLessEqual(limits[0], 6)
+        self.assertGreater(route.served, route.throttled)
+
+    def test_window_grows_while_healthy(self):
+        """With a healthy stand-in the window opens up from its initial size."""
+
+        route = ThrottlingRoute(capacity=1000)
+        client = self.run_workers(route, {**self.config, "initial_concurrency": 2, "max_concurrency": 16})
+
+        self.assertEqual(route.throttled, 0)
+        self.assertGreater(client.concurrency.limit, 2)
@@ -0,0 +1,95 @@
+import json
+import unittest
+from unittest.mock import Mock, patch
+
+from tap_adroll.client import AdrollClient
+from tap_adroll.streams import Ads, Segments
+
+from adroll_stand_in import CLIENT_CONFIG, StandInServer
+
+
+class VersionedRoute:
+    """Serves per-advertisable records, with ETags and 304s if `use_etags` is set."""
+
+    def __init__(self, use_etags):
+        self.use_etags = use_etags
+        self.versions = {"ADV1": 1, "ADV2": 1}
+        self.conditional_headers = []
+
+    def __call__(self, params, headers):
+        advertisable = params["advertisable"]
+        etag = '"{}-{}"'.format(advertisable, self.versions[advertisable])
+        self.conditional_headers.append(headers.get("If-None-Match"))
+        if self.use_etags and headers.get("If-None-Match") == etag:
+            return 304, {"ETag": etag}, b""
+        body = {"results": [{"eid": "{}-v{}".format(advertisable, self.versions[advertisable])}]}
+        return 200, {"ETag": etag} if self.use_etags else {}, body
+
+
+class TestConditionalRequests(unittest.TestCase):
+
+    """Test skipping advertisables whose responses have not changed since the last run."""
+
+    def setUp(self):
+        self.config = {
+            **CLIENT_CONFIG,
+            "start_date": "2020-01-01T00:00:00Z",
+            "skip_unchanged_partitions": True,
+        }
+        self.ads = VersionedRoute(use_etags=True)
+        self.segments = VersionedRoute(use_etags=False)
+        self.routes = {
+            "organization/get_advertisables": lambda params, headers: {
+                "results": [{"eid": "ADV1"}, {"eid": "ADV2"}]},
+            "advertisable/get_ads": self.ads,
+            "advertisable/get_segments": self.segments,
+        }
+
+    def run_stream(self, stream_class, state, config=None):
+        config = config or self.config
+        with patch("tap_adroll.client.ENDPOINT_BASE", self.stand_in.base_url), patch("singer.write_state"):
+            client = AdrollClient("/dev/null", config, True)
+            return [rec["eid"] for rec in stream_class(client, config, state).sync()]
+
+    def test_etag_revalidation(self):
+        """Unchanged advertisables answer 304 and are skipped, changed ones are emitted."""
+
+        state = {}
+        with StandInServer(self.routes) as self.stand_in:
+            self.assertEqual(self.run_stream(Ads, state), ["ADV1-v1", "ADV2-v1"])
+            self.assertEqual(state["bookmarks"]["ads"]["validators"]["ADV1"]["etag"], '"ADV1-1"')
+
+            self.assertEqual(self.run_stream(Ads, state), [])
+            self.assertEqual(self.ads.conditional_headers[-2:], ['"ADV1-1"', '"ADV2-1"'])
+
+            self.ads.versions["ADV2"] = 2
+            self.assertEqual(self.run_stream(Ads, state), ["ADV2-v2"])
+            self.assertEqual(self.run_stream(Ads, state), [])
+
+    def test_digest_comparison_skips_decoding(self):
+        """Without validators from the API, an unchanged body digest skips decoding the payload."""
+
+        state = {}
+        with StandInServer(self.routes) as self.stand_in:
+            self.assertEqual(self.run_stream(Segments, state), ["ADV1-v1", "ADV2-v1"])
+            self.assertIn("digest", state["bookmarks"]["segments"]["validators"]["ADV1"])
+
+            self.segments.versions["ADV1"] = 2
+            with patch("tap_adroll.client.get_decoder", return_value=Mock(wraps=json.loads)) as mock_decoder:
+                self.assertEqual(self.run_stream(Segments, state), ["ADV1-v2"])
+
+        # Only the advertisables and the changed ADV1 payload were decoded
+        self.assertEqual(mock_decoder.return_value.call_count, 2)
+
+    def test_disabled_by_default(self):
+        """Without skip_unchanged_partitions every record is emitted and no validators are kept."""
+
+        config = dict(self.config)
+        del config["skip_unchanged_partitions"]
+        state = {}
+        with StandInServer(self.routes) as self.stand_in:
+            self.run_stream(Ads, state, config)
+            self.assertEqual(self.run_stream(Ads, state, config), ["ADV1-v1", "ADV2-v1"])
+
+        self.assertEqual(state, {})
+        self.assertEqual(self.ads.conditional_headers, [None] * 4)
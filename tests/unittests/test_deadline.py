@@ -0,0 +1,101 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+import requests
+
+from tap_adroll.client import AdrollClient
+from tap_adroll.deadline import Deadline, SyncDeadlineReached
+from tap_adroll.discover import do_discover
+from tap_adroll.sync import do_sync
+
+from adroll_stand_in import CLIENT_CONFIG, FakeClock, StandInServer, select_streams
+
+
+class TestDeadline(unittest.TestCase):
+
+    """Test request timeouts and the whole-run deadline."""
+
+    def setUp(self):
+        self.config = {
+            **CLIENT_CONFIG,
+            "start_date": "2020-01-01T00:00:00Z",
+            "end_date": "2020-01-05T00:00:00Z",
+        }
+
+    def test_deadline_margin(self):
+        """New partitions are refused within the margin, requests only once it has passed."""
+
+        clock = FakeClock()
+        deadline = Deadline(seconds=100, margin=10, clock=clock)
+        deadline.check()
+
+        clock.now = 95
+        with self.assertRaises(SyncDeadlineReached):
+            deadline.check()
+        deadline.check_expired()
+
+        clock.now = 100
+        with self.assertRaises(SyncDeadlineReached):
+            deadline.check_expired()
+
+    def test_no_deadline_by_default(self):
+        """Without sync_deadline_seconds the run is unbounded."""
+
+        deadline = Deadline.from_config({})
+        self.assertIsNone(deadline.remaining())
+        deadline.check()
+        deadline.check_expired()
+
+    def test_read_timeout_is_enforced(self):
+        """A stalled response fails with a read timeout instead of hanging the run."""
+
+        def stalled(params, headers):
+            threading.Event().wait(2)
+            return {"results": []}
+
+        config = {**self.config, "request_timeout": 0.2, "max_tries": 1}
+        with StandInServer({"advertisable/get_ads": stalled}) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url):
+                client = AdrollClient("/dev/null", config, True)
+                with self.assertRaises(requests.exceptions.ReadTimeout):
+                    client.get("advertisable/get_ads")
+
+    def test_read_timeout_is_clamped_to_deadline(self):
+        """Reads are never allowed to run past the end of the deadline."""
+
+        with patch("tap_adroll.client.AdrollClient.get"):
+            client = AdrollClient("/dev/null", {**self.config, "sync_deadline_seconds": 30}, True)
+        self.assertEqual(client._timeout()[0], 10.0)
+        self.assertLessEqual(client._timeout()[1], 30.0)
+
+    @patch("singer.write_record")
+    @patch("singer.write_state")
+    def test_sync_stops_cleanly_at_deadline(self, mock_write_state, mock_write_record):
+        """do_sync stops before starting a new day once the deadline approaches and emits the safe state."""
+
+        clock = FakeClock()
+
+        def report(params, headers):
+            clock.now += 10
+            return {"results": [{"eid": "ad-" + params["advertisable"]}]}
+
+        routes = {
+            "organization/get_advertisables": lambda params, headers: {"results": [{"eid": "ADV1"}, {"eid": "ADV2"}]},
+            "report/ad": report,
+        }
+        state = {}
+        catalog = select_streams(do_discover(), ["ad_reports"])
+        with StandInServer(routes) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url):
+                client = AdrollClient("/dev/null", self.config, True)
+                client.deadline = Deadline(seconds=50, margin=15, clock=clock)
+                do_sync(client, self.config, state, catalog)
+
+        # Two days of two advertisables use 40 of the 50 seconds, leaving less than a day
+        self.assertEqual(mock_write_record.call_count, 4)
+        self.assertEqual(state["bookmarks"]["ad_reports"]["advertisables"],
+                         {"ADV1": "2020-01-02T00:00:00.000000Z", "ADV2": "2020-01-02T00:00:00.000000Z"})
+        # One STATE per completed day, then the final safe STATE on the way out
+        self.assertEqual(mock_write_state.call_count, 3)
+        mock_write_state.assert_called_with(state)
@@ -0,0 +1,91 @@
+import json
+import os
+import time
+import unittest
+from unittest.mock import patch
+
+from tap_adroll import decoding
+from tap_adroll.decoding import get_decoder, orjson_loads, stdlib_loads
+
+SCHEMAS_DIR = os.path.join(os.path.dirname(decoding.__file__), "schemas")
+
+
+def sample_value(schema, index):
+    types = [type_ for type_ in schema.get("type", ["string"]) if type_ != "null"]
+    type_ = types[0] if types else "string"
+    if type_ == "integer":
+        return index * 7919
+    if type_ == "number":
+        return index * 0.37 + 0.125
+    if type_ == "boolean":
+        return index % 2 == 0
+    if type_ == "object":
+        return {key: sample_value(prop, index) for key, prop in schema.get("properties", {}).items()}
+    if type_ == "array":
+        return [sample_value(schema.get("items", {}), index)]
+    if schema.get("format") == "date-time":
+        return "2020-01-{:02d}T00:00:00+0000".format(index % 28 + 1)
+    return "value-{}-é中".format(index)
+
+
+def sample_payload(stream_name, count):
+    with open(os.path.join(SCHEMAS_DIR, stream_name + ".json")) as file:
+        schema = json.load(file)
+    return json.dumps({"results": [sample_value(schema, index) for index in range(count)]}).encode("utf-8")
+
+
+class TestDecoding(unittest.TestCase):
+
+    """Test the pluggable JSON decoder used for response bodies."""
+
+    def setUp(self):
+        self.payloads = {
+            "advertisables": sample_payload("advertisables", 500),
+            "ad_reports": sample_payload("ad_reports", 5000),
+        }
+
+    @unittest.skipIf(decoding.orjson is None, "orjson is not installed")
+    def test_parity_with_stdlib(self):
+        """orjson decodes AdRoll payloads and edge cases, integers wider than 64 bits included, exactly like the stdlib."""
+
+        documents = list(self.payloads.values()) + [
+            b'{"results": [], "message": "\\u00e9\\ud83d\\ude00"}',
+            b'{"value": NaN, "big": 1e400}',
+            b'"\\ud800"',
+            b'{"a": 1, "a": 2}',
+            b'[-0, 0.1, 1.5e-7, 9007199254740993]',
+            b'{"eid": 123456789012345678901234567890, "spend": -18446744073709551616}',
+            '{"results": [18446744073709551616]}',
+            b'{"cost": -9223372036854775809, "eid": 9223372036854775808}',
+        ]
+        for document in documents:
+            decoded = orjson_loads(document)
+            self.assertEqual(decoded, stdlib_loads(document))
+            self.assertEqual(json.dumps(decoded), json.dumps(stdlib_loads(document)))
+
+    def test_decoder_selection(self):
+        """json_decoder picks the decoder, auto falls back to the stdlib without orjson."""
+
+        self.assertIs(get_decoder("stdlib"), stdlib_loads)
+        self.assertIs(get_decoder(), stdlib_loads if decoding.orjson is None else orjson_loads)
+        with patch("tap_adroll.decoding.orjson", None):
+            self.assertIs(get_decoder("auto"), stdlib_loads)
+            with self.assertRaises(Exception):
+                get_decoder("orjson")
+        with self.assertRaises(Exception):
+            get_decoder("simdjson")
+
+    def test_decoder_benchmark(self):
+        """Benchmark decoding representative advertisables and report/ad payloads."""
+
+        runs = 5
+        for name, payload in self.payloads.items():
+            for decoder_name in ["stdlib", "orjson"] if decoding.orjson else ["stdlib"]:
+                decode = get_decoder(decoder_name)
+                start = time.perf_counter()
+                for _ in range(runs):
+                    decode(payload)
+                elapsed = (time.perf_counter() - start) / runs
+                print("{} ({:.0f}KB) with {}: {:.2f}ms".format(name, len(payload) / 1024, decoder_name,
+                                                              elapsed * 1000))
+                self.assertEqual(len(decode(payload)["results"]), len(json.loads(payload)["results"]))
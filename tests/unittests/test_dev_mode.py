@@ -45,13 +45,14 @@ class Test_ClientDevMode(unittest.TestCase):
     def tearDown(self):
         """Deletes the sample config"""
 
-        if os.path.isfile(self.tmp_config_filename):
-            os.remove(self.tmp_config_filename)
+        for filename in (self.tmp_config_filename, self.tmp_config_filename + ".lock"):
+            if os.path.isfile(filename):
+                os.remove(filename)
 
     @patch(
         "requests.Session.request",
         return_value=MagicMock(
-            return_value={"results": {"eid": 12345}}, status_code=200
+            content=b'{"results": {"eid": 12345}}', status_code=200
         ),
     )
     def test_client_with_dev_mode(self, mock_request):
@@ -59,6 +60,7 @@ class Test_ClientDevMode(unittest.TestCase):
 
         client = AdrollClient(self.tmp_config_filename, self.mock_config, True)
         client.authenticate_request()
+        client.organization_eid
 
         headers = {"Authorization": f"Bearer {self.mock_config['access_token']}"}
 
@@ -68,19 +70,30 @@ class Test_ClientDevMode(unittest.TestCase):
             headers=headers,
             params=None,
             data=None,
+            timeout=(10.0, 300.0),
+            stream=False,
         )
 
+    @patch(
+        "requests_oauthlib.OAuth2Session.refresh_token",
+        return_value={
+            "access_token": "refreshed_access_token",
+            "refresh_token": "refreshed_refresh_token",
+            "token_type": "Bearer",
+        },
+    )
     @patch(
         "requests_oauthlib.OAuth2Session.request",
         return_value=MagicMock(
-            return_value={"results": {"eid": 12345}}, status_code=200
+            content=b'{"results": {"eid": 12345}}', status_code=200
         ),
     )
-    def test_client_without_dev_mode(self, mock_request):
+    def test_client_without_dev_mode(self, mock_request, mock_refresh_token):
         """Checking the code flow without dev mode"""
 
         client = AdrollClient(self.tmp_config_filename, self.mock_config, False)
         client.authenticate_request()
+        client.organization_eid
 
         mock_request.assert_called_with(
             "GET",
@@ -88,6 +101,8 @@ class Test_ClientDevMode(unittest.TestCase):
             headers=None,
             params=None,
             data=None,
+            timeout=(10.0, 300.0),
+            stream=False,
         )
 
     @patch("tap_adroll.client.requests.Session.request")
@@ -0,0 +1,59 @@
+import json
+import os
+import socket
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import tap_adroll
+from tap_adroll.discover import do_discover
+
+
+class TestOfflineDiscovery(unittest.TestCase):
+
+    """Test that discovery runs without credentials or network access."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.config_path = os.path.join(self.tmp_dir.name, "config.json")
+        with open(self.config_path, "w") as file:
+            json.dump({"start_date": "2020-01-01T00:00:00Z"}, file)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    @patch("socket.socket", side_effect=AssertionError("Discovery must not open sockets"))
+    @patch("tap_adroll.AdrollClient")
+    @patch("tap_adroll.write_catalog")
+    def test_discover_without_client(self, mock_write_catalog, mock_client, mock_socket):
+        """--discover with a config holding no credentials writes the catalog without building a client."""
+
+        with patch("sys.argv", ["tap-adroll", "--config", self.config_path, "--discover"]):
+            tap_adroll.main()
+
+        mock_client.assert_not_called()
+        mock_socket.assert_not_called()
+        catalog = mock_write_catalog.call_args[0][0]
+        self.assertEqual(sorted(stream.tap_stream_id for stream in catalog.streams),
+                         ["ad_groups", "ad_reports", "ads", "advertisables", "campaigns", "segments"])
+
+    @patch("tap_adroll.write_catalog")
+    def test_discover_startup_benchmark(self, mock_write_catalog):
+        """Benchmark end-to-end discovery from argument parsing to the written catalog."""
+
+        runs = 20
+        with patch("sys.argv", ["tap-adroll", "--config", self.config_path, "--discover"]):
+            start = time.perf_counter()
+            for _ in range(runs):
+                tap_adroll.main()
+            elapsed = (time.perf_counter() - start) / runs
+
+        print("discovery: {:.2f}ms per run".format(elapsed * 1000))
+        self.assertEqual(mock_write_catalog.call_count, runs)
+        self.assertLess(elapsed, 0.5)
+
+    def test_discover_is_deterministic(self):
+        """Discovery returns the same catalog on every call."""
+
+        self.assertEqual(do_discover().to_dict(), do_discover().to_dict())
@@ -0,0 +1,130 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from tap_adroll.client import AdrollClient
+from tap_adroll.streams import AdReports, Ads, iterate_async
+
+from adroll_stand_in import ADVERTISABLE_EIDS, CLIENT_CONFIG, InFlightRoute, StandInServer, advertisables_route
+
+
+class TestPartitionFanOut(unittest.TestCase):
+
+    """Test the bounded fan-out over advertisables of the asyncio streams."""
+
+    def setUp(self):
+        self.config = {
+            **CLIENT_CONFIG,
+            "start_date": "2020-01-01T00:00:00Z",
+        }
+        self.ads_route = InFlightRoute(
+            lambda params: {"results": [{"eid": "ad-" + params["advertisable"]}]})
+        self.routes = {
+            "organization/get_advertisables": advertisables_route(),
+            "advertisable/get_ads": self.ads_route,
+        }
+
+    def sync_ads(self, config):
+        with StandInServer(self.routes) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url):
+                client = AdrollClient("/dev/null", config, True)
+                stream = Ads(client, config, {})
+                start = time.monotonic()
+                if config.get("async_concurrency"):
+                    records = iterate_async(stream.sync_async(), stream.async_concurrency)
+                else:
+                    records = stream.sync()
+                records = [rec["eid"] for rec in records]
+                return records, time.monotonic() - start
+
+    def test_concurrent_fan_out_is_bounded_and_faster(self):
+        """With async_concurrency, advertisables are fetched in parallel up to the limit."""
+
+        sequential, sequential_elapsed = self.sync_ads(self.config)
+        self.assertEqual(self.ads_route.max_in_flight, 1)
+
+        concurrent, concurrent_elapsed = self.sync_ads({**self.config, "async_concurrency": 5})
+
+        print("ads for {} advertisables: {:.2f}s sequential, {:.2f}s with 5 workers".format(
+            len(ADVERTISABLE_EIDS), sequential_elapsed, concurrent_elapsed))
+        self.assertCountEqual(concurrent, sequential)
+        self.assertGreater(self.ads_route.max_in_flight, 1)
+        self.assertLessEqual(self.ads_route.max_in_flight, 5)
+        self.assertLess(concurrent_elapsed, sequential_elapsed)
+
+    def test_ordered_mode_keeps_advertisable_order(self):
+        """ordered_partitions emits advertisables in order even when later ones finish first."""
+
+        delays = {eid: 0.1 if i % 3 == 0 else 0.01 for i, eid in enumerate(ADVERTISABLE_EIDS)}
+
+        def ads(params, headers):
+            threading.Event().wait(delays[params["advertisable"]])
+            return {"results": [{"eid": "ad-" + params["advertisable"]}]}
+
+        self.routes["advertisable/get_ads"] = ads
+        records, _ = self.sync_ads({**self.config, "async_concurrency": 4, "ordered_partitions": True})
+        self.assertEqual(records, ["ad-" + eid for eid in ADVERTISABLE_EIDS])
+
+    def test_closing_early_stops_submitting(self):
+        """Closing the generator never fetches the advertisables that have not started."""
+
+        with StandInServer(self.routes) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url):
+                config = {**self.config, "async_concurrency": 2}
+                client = AdrollClient("/dev/null", config, True)
+                stream = Ads(client, config, {})
+                records = iterate_async(stream.sync_async(), stream.async_concurrency)
+                self.assertIn(next(records)["eid"], ("ad-ADV0", "ad-ADV1"))
+                records.close()
+
+        self.assertLessEqual(len(stand_in.requests_to("advertisable/get_ads")), 4)
+
+
+class TestAdReportsGrid(unittest.TestCase):
+
+    """Test fetching the date by advertisable grid of ad_reports concurrently."""
+
+    def setUp(self):
+        self.config = {
+            **CLIENT_CONFIG,
+            "start_date": "2020-01-01T00:00:00Z",
+            "end_date": "2020-01-04T00:00:00Z",
+            "async_concurrency": 6,
+        }
+        self.report_route = InFlightRoute(lambda params: {"results": [{"eid": "report-" + params["advertisable"]}]},
+                                          delay=0.01)
+        self.routes = {
+            "organization/get_advertisables": advertisables_route(ADVERTISABLE_EIDS[:5]),
+            "report/ad": self.report_route,
+        }
+
+    def test_bookmark_only_covers_fully_emitted_days(self):
+        """Each bookmark written is a day for which it and every earlier day of the advertisable were emitted."""
+
+        state = {}
+        emitted = []
+        checked = {}
+
+        def check_bookmarks(written_state):
+            for eid, bookmark in written_state["bookmarks"]["ad_reports"]["advertisables"].items():
+                for day in ["2020-01-0{}T00:00:00.000000Z".format(day) for day in range(1, 5)]:
+                    if day <= bookmark:
+                        self.assertIn({"eid": "report-" + eid, "date": day}, emitted)
+                checked.setdefault(eid, []).append(bookmark)
+
+        with patch("singer.write_state", side_effect=check_bookmarks):
+            with StandInServer(self.routes) as stand_in:
+                with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url):
+                    client = AdrollClient("/dev/null", self.config, True)
+                    stream = AdReports(client, self.config, state)
+                    for rec in iterate_async(stream.sync_async(), stream.async_concurrency):
+                        emitted.append(rec)
+
+        self.assertEqual(len(emitted), 20)
+        self.assertGreater(self.report_route.max_in_flight, 1)
+        self.assertLessEqual(self.report_route.max_in_flight, 6)
+        self.assertEqual(state["bookmarks"]["ad_reports"]["advertisables"],
+                         {eid: "2020-01-04T00:00:00.000000Z" for eid in ADVERTISABLE_EIDS[:5]})
+        for bookmarks in checked.values():
+            self.assertEqual(bookmarks, sorted(bookmarks))
@@ -0,0 +1,105 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from tap_adroll.client import AdrollClient
+from tap_adroll.hedging import RequestHedger, latency_percentile
+
+from adroll_stand_in import CLIENT_CONFIG, StandInServer
+
+
+class FirstCallStalls:
+    """The first request for each advertisable stalls, any duplicate answers at once."""
+
+    def __init__(self, stall=1.0):
+        self.stall = stall
+        self.seen = set()
+        self.lock = threading.Lock()
+
+    def __call__(self, params, headers):
+        with self.lock:
+            first = params["advertisable"] not in self.seen
+            self.seen.add(params["advertisable"])
+        if first:
+            threading.Event().wait(self.stall)
+        return {"results": [{"eid": params["advertisable"], "first": first}]}
+
+
+class TestRequestHedging(unittest.TestCase):
+
+    """Test hedged requests against a local stand-in."""
+
+    def setUp(self):
+        self.config = {
+            **CLIENT_CONFIG,
+            "hedge_requests": True,
+            "hedge_min_samples": 5,
+        }
+
+    def test_latency_percentile(self):
+        """Percentiles are taken by nearest rank."""
+
+        values = list(range(1, 101))
+        self.assertEqual(latency_percentile(values, 95), 95)
+        self.assertEqual(latency_percentile(values, 50), 50)
+        self.assertEqual(latency_percentile([3], 99), 3)
+
+    def test_slow_request_is_hedged(self):
+        """A request outstanding past the percentile latency is duplicated and the hedge wins."""
+
+        with StandInServer({"report/ad": FirstCallStalls()}) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url):
+                client = AdrollClient("/dev/null", self.config, True)
+                for _ in range(5):
+                    client.hedger.record("report/ad", 0.01)
+
+                start = time.monotonic()
+                records = client.get("report/ad", params={"advertisable": "ADV1"})
+                elapsed = time.monotonic() - start
+
+            self.assertEqual(len(stand_in.requests_to("report/ad")), 2)
+
+        self.assertFalse(records["results"][0]["first"])
+        self.assertLess(elapsed, 0.9)
+        self.assertEqual(client.hedger.stats["report/ad"], {"hedged": 1, "hedge_wins": 1})
+
+    def test_no_hedge_before_enough_samples(self):
+        """Requests are not hedged until the endpoint has enough latency samples."""
+
+        with StandInServer({"report/ad": FirstCallStalls(stall=0.2)}) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url):
+                client = AdrollClient("/dev/null", self.config, True)
+                client.get("report/ad", params={"advertisable": "ADV1"})
+
+            self.assertEqual(len(stand_in.requests_to("report/ad")), 1)
+        self.assertEqual(len(client.hedger.latencies["report/ad"]), 1)
+
+    def test_other_endpoints_are_not_hedged(self):
+        """Only the configured endpoints are hedged."""
+
+        hedger = RequestHedger.from_config({"hedge_endpoints": '["report/ad"]'})
+        self.assertTrue(hedger.applies_to("report/ad"))
+        self.assertFalse(hedger.applies_to("advertisable/get_ads"))
+
+    def test_hedges_count_against_rate_limiter(self):
+        """Both the original request and its hedge acquire rate limiter tokens."""
+
+        with StandInServer({"report/ad": FirstCallStalls(stall=0.5)}) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url):
+                client = AdrollClient("/dev/null", self.config, True)
+                for _ in range(5):
+                    client.hedger.record("report/ad", 0.01)
+                with patch.object(client.rate_limiter, "acquire") as mock_acquire:
+                    client.get("report/ad", params={"advertisable": "ADV1"})
+
+        self.assertEqual(mock_acquire.call_count, 2)
+
+    def test_hedging_disabled_by_default(self):
+        """Without hedge_requests the client never hedges."""
+
+        config = dict(self.config)
+        del config["hedge_requests"]
+        with patch("tap_adroll.client.AdrollClient.get"):
+            client = AdrollClient("/dev/null", config, True)
+        self.assertIsNone(client.hedger)
@@ -0,0 +1,102 @@
+import unittest
+from unittest.mock import patch
+
+from tap_adroll.client import AdrollClient
+from tap_adroll.discover import do_discover
+from tap_adroll.http_metrics import HttpMetrics
+from tap_adroll.sync import do_sync
+
+from adroll_stand_in import CLIENT_CONFIG, StandInServer, logged_metric_points, select_streams
+
+
+class TestHttpMetrics(unittest.TestCase):
+
+    """Test the METRIC messages emitted for HTTP requests."""
+
+    def setUp(self):
+        self.config = {
+            **CLIENT_CONFIG,
+            "start_date": "2020-01-01T00:00:00Z",
+        }
+        self.failures = {"ADV2": 1}
+
+    def get_ads(self, params, headers):
+        if self.failures.get(params["advertisable"]):
+            self.failures[params["advertisable"]] -= 1
+            return 500, {}, {"message": "error"}
+        return {"results": [{"eid": "ad-" + params["advertisable"]}]}
+
+    @patch("time.sleep")
+    @patch("singer.write_record")
+    @patch("singer.write_state")
+    @patch("tap_adroll.http_metrics.LOGGER")
+    def test_requests_are_timed_and_histograms_logged_per_stream(self, mock_logger, *_):
+        """Every response is a tagged timer point, and each stream ends with its latency histograms."""
+
+        routes = {
+            "organization/get_advertisables": lambda params, headers: {"results": [{"eid": "ADV1"}, {"eid": "ADV2"}]},
+            "advertisable/get_ads": self.get_ads,
+            "advertisable/get_campaigns": lambda params, headers: {"results": []},
+        }
+        catalog = select_streams(do_discover(), ["ads", "campaigns"])
+        with StandInServer(routes) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url):
+                client = AdrollClient("/dev/null", self.config, True)
+                do_sync(client, self.config, {}, catalog)
+
+        points = logged_metric_points(mock_logger)
+        timers = [point for point in points if point["type"] == "timer"]
+        ads_timers = [point["tags"] for point in timers if point["tags"]["endpoint"] == "advertisable/get_ads"]
+        self.assertEqual(sorted(tags["http_status_code"] for tags in ads_timers), [200, 200, 500])
+        for tags in ads_timers:
+            self.assertEqual(tags["status"], "failed" if tags["http_status_code"] == 500 else "succeeded")
+            self.assertGreater(tags["response_bytes"], 0)
+        self.assertTrue(all(point["metric"] == "http_request_duration" for point in timers))
+
+        histograms = [point for point in points if point["metric"] == "http_request_duration_bucket"]
+        self.assertTrue(all(point["type"] == "counter" for point in histograms))
+        totals = {(point["tags"]["stream"], point["tags"]["endpoint"]): point["value"]
+                  for point in histograms if point["tags"]["le"] == "+Inf"}
+        # The advertisables are requested once, by whichever stream syncs first
+        first_stream = next(catalog.get_selected_streams({})).tap_stream_id
+        self.assertEqual(totals, {
+            (first_stream, "organization/get_advertisables"): 1,
+            ("ads", "advertisable/get_ads"): 3,
+            ("campaigns", "advertisable/get_campaigns"): 2,
+        })
+
+    @patch("tap_adroll.http_metrics.LOGGER")
+    def test_timers_are_sampled_per_endpoint_and_status(self, mock_logger):
+        """With metric_sample_every only the first of that many responses is timed, but all are bucketed."""
+
+        http_metrics = HttpMetrics.from_config({"metric_sample_every": 3, "log_sample_every": 100})
+        for _ in range(7):
+            http_metrics.record("report/ad", 0.2, 200, 10)
+        http_metrics.record("report/ad", 0.2, 500, 10)
+        http_metrics.record("report/ad", 0.2)
+        http_metrics.log_histograms()
+
+        points = logged_metric_points(mock_logger)
+        self.assertEqual([point["tags"]["http_status_code"] for point in points if point["type"] == "timer"],
+                         [200, 200, 200, 500, None])
+        self.assertEqual([point["value"] for point in points if point["tags"].get("le") == "+Inf"], [9])
+
+    @patch("tap_adroll.http_metrics.LOGGER")
+    def test_histogram_buckets_are_cumulative(self, mock_logger):
+        """Each bucket counts the requests at or under its bound, and requests without a response count too."""
+
+        http_metrics = HttpMetrics(buckets=[0.5, 1.0])
+        for latency in (0.2, 0.5, 0.7, 3.0):
+            http_metrics.record("report/ad", latency, 200, 10)
+        http_metrics.record("report/ad", 0.1)
+        http_metrics.log_histograms()
+
+        points = logged_metric_points(mock_logger)
+        self.assertEqual(points[4]["tags"], {"endpoint": "report/ad", "http_status_code": None,
+                                             "status": "failed", "response_bytes": None})
+        self.assertEqual([(point["tags"]["le"], point["value"]) for point in points[5:]],
+                         [(0.5, 3), (1.0, 4), ("+Inf", 5)])
+
+        # Histograms only cover requests since they were last logged
+        http_metrics.log_histograms()
+        self.assertEqual(len(logged_metric_points(mock_logger)), 8)
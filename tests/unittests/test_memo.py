@@ -0,0 +1,93 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+from tap_adroll.client import AdrollClient
+from tap_adroll.memo import RequestMemo
+from tap_adroll.streams import Ads, Advertisables, Campaigns
+
+from adroll_stand_in import CLIENT_CONFIG, StandInServer
+
+
+class TestRequestMemo(unittest.TestCase):
+
+    """Test that parent endpoints are requested once per run."""
+
+    def setUp(self):
+        self.config = {
+            **CLIENT_CONFIG,
+            "start_date": "2020-01-01T00:00:00Z",
+        }
+        self.release = threading.Event()
+        self.routes = {
+            "organization/get_advertisables": lambda params, headers: {
+                "results": [{"eid": "ADV1"}, {"eid": "ADV2"}]},
+            "advertisable/get_ads": lambda params, headers: {"results": [{"eid": "ad-" + params["advertisable"]}]},
+            "advertisable/get_campaigns": lambda params, headers: {"results": []},
+        }
+
+    def test_parent_endpoint_requested_once(self):
+        """Advertisables and every child stream share one organization/get_advertisables request."""
+
+        with StandInServer(self.routes) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url):
+                client = AdrollClient("/dev/null", self.config, True)
+                advertisables = list(Advertisables(client, self.config, {}).sync())
+                for stream_class in (Ads, Campaigns):
+                    list(stream_class(client, self.config, {}).sync())
+
+            self.assertEqual(len(stand_in.requests_to("organization/get_advertisables")), 1)
+            self.assertEqual(len(stand_in.requests_to("advertisable/get_ads")), 2)
+
+        # Callers get their own copies of memoized records
+        advertisables[0]["eid"] = "changed"
+        self.assertEqual(client.get("organization/get_advertisables")["results"][0]["eid"], "ADV1")
+
+    def test_concurrent_callers_share_one_request(self):
+        """Callers arriving while the request is in flight wait for it rather than sending their own."""
+
+        def slow_advertisables(params, headers):
+            self.release.wait(5)
+            return {"results": [{"eid": "ADV1"}]}
+
+        with StandInServer({"organization/get_advertisables": slow_advertisables}) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url):
+                client = AdrollClient("/dev/null", self.config, True)
+                results = []
+                threads = [threading.Thread(target=lambda: results.append(client.get("organization/get_advertisables")))
+                           for _ in range(8)]
+                for thread in threads:
+                    thread.start()
+                threading.Event().wait(0.2)
+                self.release.set()
+                for thread in threads:
+                    thread.join()
+
+            self.assertEqual(len(stand_in.requests_to("organization/get_advertisables")), 1)
+            self.assertEqual(len(results), 8)
+            self.assertEqual((client.request_memo.misses, client.request_memo.hits), (1, 7))
+
+    def test_failures_are_not_memoized(self):
+        """A failed request is retried by the next caller."""
+
+        memo = RequestMemo(endpoints=["x"])
+        with self.assertRaises(ValueError):
+            memo.get("x", {}, lambda: (_ for _ in ()).throw(ValueError("boom")))
+        self.assertEqual(memo.get("x", {}, lambda: b"ok"), b"ok")
+
+    def test_eviction_and_invalidation(self):
+        """Least recently used bodies are dropped past max_bytes, and endpoints can be invalidated."""
+
+        memo = RequestMemo(endpoints=["x", "y"], max_bytes=10)
+        memo.get("x", {"id": 1}, lambda: b"a" * 5)
+        memo.get("x", {"id": 2}, lambda: b"b" * 5)
+        memo.get("x", {"id": 1}, lambda: b"unused")
+        memo.get("y", {}, lambda: b"c" * 5)
+
+        self.assertEqual(memo.get("x", {"id": 1}, lambda: b"refetched"), b"a" * 5)
+        self.assertEqual(memo.get("x", {"id": 2}, lambda: b"refetched"), b"refetched")
+
+        memo.invalidate("x")
+        self.assertEqual(memo.get("x", {"id": 1}, lambda: b"new"), b"new")
+        memo.invalidate()
+        self.assertEqual((len(memo.entries), memo.size), (0, 0))
@@ -0,0 +1,103 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from tap_adroll.client import AdrollClient
+from tap_adroll.rate_limit import RateLimiter, parse_retry_after
+
+from adroll_stand_in import FakeClock, StandInServer
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    """Test the token-bucket rate limiter."""
+
+    def test_global_rate_is_enforced(self):
+        """After the initial burst, requests are spaced at the configured rate."""
+
+        clock = FakeClock()
+        limiter = RateLimiter(rate=2, clock=clock, sleep=clock.sleep)
+        for _ in range(6):
+            limiter.acquire("advertisable/get_ads")
+
+        self.assertAlmostEqual(clock.now, 2.0)
+
+    def test_endpoint_override_is_stricter(self):
+        """An endpoint override limits that endpoint without slowing the others."""
+
+        clock = FakeClock()
+        limiter = RateLimiter(rate=100, endpoint_rates={"report/ad": 1}, clock=clock, sleep=clock.sleep)
+        for _ in range(3):
+            limiter.acquire("report/ad")
+        self.assertAlmostEqual(clock.now, 2.0)
+
+        clock.sleeps.clear()
+        for _ in range(3):
+            limiter.acquire("advertisable/get_ads")
+        self.assertEqual(clock.sleeps, [])
+
+    def test_throttle_honors_retry_after_and_slows_down(self):
+        """A 429 pauses the governing bucket for Retry-After and halves its rate."""
+
+        clock = FakeClock()
+        limiter = RateLimiter(endpoint_rates={"report/ad": 4}, clock=clock, sleep=clock.sleep)
+        limiter.throttled("report/ad", 3)
+        limiter.acquire("report/ad")
+
+        self.assertAlmostEqual(clock.now, 3.0)
+        self.assertEqual(limiter.endpoint_buckets["report/ad"].rate, 2)
+
+        for _ in range(40):
+            limiter.succeeded("report/ad")
+        self.assertEqual(limiter.endpoint_buckets["report/ad"].rate, 4)
+
+    def test_throttle_without_configured_rate_pauses_everyone(self):
+        """Without a configured rate a 429 still pauses all callers."""
+
+        clock = FakeClock()
+        limiter = RateLimiter(clock=clock, sleep=clock.sleep)
+        limiter.throttled("report/ad", None)
+        limiter.acquire("advertisable/get_ads")
+
+        self.assertAlmostEqual(clock.now, 1.0)
+
+    def test_shared_between_threads(self):
+        """Threads sharing one limiter are collectively held to its rate."""
+
+        limiter = RateLimiter(rate=50)
+        start = time.monotonic()
+        threads = [threading.Thread(target=lambda: [limiter.acquire("x") for _ in range(15)])
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # 60 requests with a burst of 50 need at least 10 more tokens at 50/sec
+        self.assertGreaterEqual(time.monotonic() - start, 0.18)
+
+    def test_parse_retry_after(self):
+        """Retry-After may be given in seconds or as an HTTP date."""
+
+        self.assertEqual(parse_retry_after("5"), 5.0)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+        self.assertEqual(parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0.0)
+
+    @patch("tap_adroll.client.RateLimiter.throttled")
+    def test_client_reports_429(self, mock_throttled):
+        """The client feeds 429 responses and their Retry-After to the limiter."""
+
+        config = {"access_token": "a", "refresh_token": "r", "client_id": "c", "client_secret": "s",
+                  "endpoint_requests_per_second": '{"report/ad": 5}'}
+        routes = {"report/ad": lambda params, headers: (429, {"Retry-After": "7"}, {})}
+        with StandInServer(routes) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url):
+                client = AdrollClient("/dev/null", config, True)
+                with patch("time.sleep"):
+                    with self.assertRaises(Exception):
+                        client.get("report/ad")
+
+        self.assertIn("report/ad", client.rate_limiter.endpoint_buckets)
+        mock_throttled.assert_called_with("report/ad", 7.0)
@@ -0,0 +1,82 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+from tap_adroll.client import AdrollClient
+from tap_adroll.registry import AdvertisableRegistry
+from tap_adroll.streams import Ads, Advertisables
+
+from adroll_stand_in import CLIENT_CONFIG, StandInServer
+
+ADVERTISABLES = [{"eid": "ADV{}".format(i), "name": "Advertisable {}".format(i)} for i in range(5)]
+
+
+class TestAdvertisableRegistry(unittest.TestCase):
+
+    """Test the advertisables shared by every stream."""
+
+    def setUp(self):
+        self.config = {
+            **CLIENT_CONFIG,
+            "start_date": "2020-01-01T00:00:00Z",
+        }
+        self.routes = {
+            "organization/get_advertisables": lambda params, headers: {"results": ADVERTISABLES},
+            "advertisable/get_ads": lambda params, headers: {"results": [{"eid": "ad-" + params["advertisable"]}]},
+        }
+
+    def test_concurrent_callers_fetch_once(self):
+        """Callers arriving while the advertisables are fetched wait for that fetch."""
+
+        registry = AdvertisableRegistry()
+        started = threading.Event()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            started.set()
+            threading.Event().wait(0.05)
+            yield from ADVERTISABLES
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(registry.eids(fetch))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [[rec["eid"] for rec in ADVERTISABLES]] * 5)
+
+    def test_failed_fetch_publishes_nothing(self):
+        """A fetch that fails part way leaves no partial list, and the next caller fetches again."""
+
+        registry = AdvertisableRegistry()
+
+        def failing_fetch():
+            yield ADVERTISABLES[0]
+            raise Exception("connection reset")
+
+        with self.assertRaises(Exception):
+            registry.records(failing_fetch)
+        self.assertEqual(registry.records(lambda: ADVERTISABLES), tuple(ADVERTISABLES))
+
+        registry.invalidate()
+        self.assertEqual(registry.eids(lambda: ADVERTISABLES[:1]), ["ADV0"])
+
+    def test_streams_share_the_full_list(self):
+        """Advertisables.sync serves full records, and stopping it early still leaves every eid for the child streams."""
+
+        with StandInServer(self.routes) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url):
+                client = AdrollClient("/dev/null", self.config, True)
+                advertisables = Advertisables(client, self.config, {}).sync()
+                self.assertEqual(next(advertisables), ADVERTISABLES[0])
+                advertisables.close()
+                ads = [rec["eid"] for rec in Ads(client, self.config, {}).sync()]
+
+                client.invalidate_advertisables()
+                self.assertEqual(list(Advertisables(client, self.config, {}).sync()), ADVERTISABLES)
+
+        self.assertEqual(ads, ["ad-" + rec["eid"] for rec in ADVERTISABLES])
+        self.assertEqual(len(stand_in.requests_to("organization/get_advertisables")), 2)
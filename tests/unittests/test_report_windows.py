@@ -0,0 +1,145 @@
+import datetime
+import unittest
+from unittest.mock import Mock, patch
+
+from tap_adroll.client import AdrollClient
+from tap_adroll.report_windows import ReportWindowSizer
+from tap_adroll.streams import AdReports, iterate_async
+
+from adroll_stand_in import CLIENT_CONFIG, StandInServer, advertisables_route
+
+ADVERTISABLE_EIDS = ["ADV0", "ADV1", "ADV2"]
+
+
+def report(params, headers):
+    """Serves one row per ad and day when broken down by date, else one row per ad for the whole range."""
+    start = datetime.datetime.strptime(params["start_date"], "%m-%d-%Y")
+    end = datetime.datetime.strptime(params["end_date"], "%m-%d-%Y")
+    ad = "ad-" + params["advertisable"]
+    if params.get("breakdowns") != "date":
+        return {"results": [{"eid": ad, "impressions": (end - start).days + 1}]}
+    days = [start + datetime.timedelta(days=offset) for offset in range((end - start).days + 1)]
+    return {"results": [{"eid": ad, "date": day.strftime("%Y-%m-%d"), "impressions": 1} for day in days]}
+
+
+class TestReportWindows(unittest.TestCase):
+
+    """Test fetching ad_reports for several days per request."""
+
+    def setUp(self):
+        self.config = {
+            **CLIENT_CONFIG,
+            "start_date": "2020-01-01T00:00:00Z",
+            "end_date": "2020-01-10T00:00:00Z",
+            "report_window_days": 7,
+        }
+        self.routes = {
+            "organization/get_advertisables": advertisables_route(ADVERTISABLE_EIDS),
+            "report/ad": report,
+        }
+
+    def sync_reports(self, config, state):
+        bookmarks = []
+
+        def write_state(written_state):
+            bookmarks.append(dict(written_state["bookmarks"]["ad_reports"]["advertisables"]))
+
+        with patch("singer.write_state", side_effect=write_state):
+            with StandInServer(self.routes) as stand_in:
+                with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url):
+                    client = AdrollClient("/dev/null", config, True)
+                    stream = AdReports(client, config, state)
+                    if config.get("use_asyncio"):
+                        records = list(iterate_async(stream.sync_async(), stream.async_concurrency))
+                    else:
+                        records = list(stream.sync())
+        return stand_in, records, bookmarks
+
+    def test_windows_are_split_into_daily_rows(self):
+        """Each advertisable is requested once per window, and rows keep their per-day eid and date keys."""
+
+        state = {}
+        stand_in, records, bookmarks = self.sync_reports(self.config, state)
+
+        requests = stand_in.requests_to("report/ad")
+        self.assertEqual(sorted((params["advertisable"], params["start_date"], params["end_date"]) for params in requests),
+                         sorted((eid, start, end) for eid in ADVERTISABLE_EIDS
+                                for start, end in [("01-01-2020", "01-07-2020"), ("01-08-2020", "01-10-2020")]))
+        self.assertEqual(len(records), 30)
+        self.assertEqual(len({(rec["eid"], rec["date"]) for rec in records}), 30)
+        self.assertIn({"eid": "ad-ADV1", "date": "2020-01-08T00:00:00.000000Z", "impressions": 1}, records)
+        self.assertEqual(bookmarks, [{eid: date for eid in ADVERTISABLE_EIDS}
+                                     for date in ["2020-01-07T00:00:00.000000Z", "2020-01-10T00:00:00.000000Z"]])
+
+    def test_concurrent_windows_match_sequential(self):
+        """The concurrent grid fetches the same windows and emits the same rows."""
+
+        _, sequential, _ = self.sync_reports(self.config, {})
+        state = {}
+        stand_in, concurrent, _ = self.sync_reports({**self.config, "use_asyncio": True, "async_concurrency": 4}, state)
+
+        self.assertEqual(len(stand_in.requests_to("report/ad")), 6)
+        self.assertCountEqual(concurrent, sequential)
+        self.assertEqual(state["bookmarks"]["ad_reports"]["advertisables"],
+                         {eid: "2020-01-10T00:00:00.000000Z" for eid in ADVERTISABLE_EIDS})
+
+    def test_sequential_windows_are_streamed(self):
+        """Without use_asyncio rows are emitted as the report is read, and the window is sized once it is read."""
+
+        stream = AdReports(Mock(), {**self.config, "report_window_days": 2}, {})
+        read = []
+
+        def get_report(advertisable_eid, report_date, end_date):
+            for offset in range((end_date - report_date).days + 1):
+                read.append(offset)
+                day = report_date + datetime.timedelta(days=offset)
+                yield {"eid": "ad-" + advertisable_eid, "date": day.strftime("%Y-%m-%d")}
+
+        stream.get_report = get_report
+        dates = [datetime.datetime(2020, 1, day, tzinfo=datetime.timezone.utc) for day in (1, 2, 3)]
+        with patch("singer.write_state"), patch.object(ReportWindowSizer, "observe", autospec=True) as mock_observe:
+            records = stream.sync_windows({"ADV0": dates})
+            next(records)
+            self.assertEqual(len(read), 1)
+            self.assertEqual(mock_observe.call_count, 0)
+            self.assertEqual(len(list(records)), 2)
+
+        self.assertEqual([call[0][1:3] for call in mock_observe.call_args_list], [(2, 2), (1, 1)])
+        self.assertEqual(stream.state["bookmarks"]["ad_reports"]["advertisables"],
+                         {"ADV0": "2020-01-03T00:00:00.000000Z"})
+
+    def test_single_day_requests_are_unchanged(self):
+        """Without report_window_days every request covers one day and asks for no breakdown."""
+
+        config = dict(self.config)
+        del config["report_window_days"]
+        stand_in, records, _ = self.sync_reports(config, {})
+
+        requests = stand_in.requests_to("report/ad")
+        self.assertEqual(len(requests), 30)
+        self.assertTrue(all(params["start_date"] == params["end_date"] and "breakdowns" not in params
+                            for params in requests))
+        self.assertEqual(len(records), 30)
+
+    def test_window_size_adapts(self):
+        """Slow or large windows halve the size, fast and small ones grow it back up to the maximum."""
+
+        sizer = ReportWindowSizer(max_days=8, target_seconds=10, max_records=100)
+        self.assertEqual(sizer.days, 8)
+        sizer.observe(8, 20, 12.0)
+        self.assertEqual(sizer.days, 4)
+        # A window cut before the decrease does not halve it again
+        sizer.observe(8, 200, 1.0)
+        self.assertEqual(sizer.days, 4)
+        sizer.observe(4, 200, 1.0)
+        self.assertEqual(sizer.days, 2)
+        sizer.observe(2, 0, 0.0, failed=True)
+        self.assertEqual(sizer.days, 1)
+        sizer.observe(1, 10, 1.0)
+        sizer.observe(2, 10, 1.0)
+        self.assertEqual(sizer.days, 3)
+        # Neither slow nor fast enough to change
+        sizer.observe(3, 70, 1.0)
+        self.assertEqual(sizer.days, 3)
+
+        self.assertEqual([len(window) for window in sizer.windows(list(range(10)))], [3, 3, 3, 1])
@@ -0,0 +1,83 @@
+import unittest
+from unittest.mock import patch
+
+from requests.exceptions import HTTPError
+
+from tap_adroll.client import AdrollClient
+from tap_adroll.request_log import RequestLog
+
+from adroll_stand_in import CLIENT_CONFIG, FakeClock, StandInServer
+
+
+def logged_messages(mock_logger):
+    return [call[0][0] for call in mock_logger.info.call_args_list]
+
+
+class TestRequestLog(unittest.TestCase):
+
+    """Test sampled request logging and the periodic summaries."""
+
+    def setUp(self):
+        self.config = {
+            **CLIENT_CONFIG,
+            "max_tries": 1,
+        }
+        self.routes = {
+            "advertisable/get_ads": lambda params, headers: {"results": []},
+            "report/ad": lambda params, headers: (500, {}, {"message": "error"}),
+        }
+
+    def run_requests(self, config, count):
+        with StandInServer(self.routes) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url):
+                client = AdrollClient("/dev/null", config, True)
+                for i in range(count):
+                    client.get("advertisable/get_ads", params={"advertisable": i})
+                with self.assertRaises(HTTPError):
+                    client.get("report/ad")
+                client.log_summary()
+
+    @patch("tap_adroll.request_log.LOGGER")
+    def test_sampled_by_default(self, mock_logger):
+        """Only one in every log_sample_every request lines is logged, then a summary per endpoint."""
+
+        self.run_requests({**self.config, "log_sample_every": 100}, 250)
+
+        messages = logged_messages(mock_logger)
+        request_lines = [m for m in messages if "Making request" in m]
+        self.assertEqual(len(request_lines), 3)
+        summaries = [call[0] for call in mock_logger.info.call_args_list if call[0][0].startswith("Endpoint")]
+        self.assertEqual([(summary[1], summary[2], summary[-1]) for summary in summaries],
+                         [("advertisable/get_ads", 250, 0), ("report/ad", 1, 1)])
+
+    @patch("tap_adroll.request_log.LOGGER")
+    def test_debug_logging_logs_every_request(self, mock_logger):
+        """debug_logging restores a line per request."""
+
+        self.run_requests({**self.config, "debug_logging": "true"}, 250)
+
+        request_lines = [m for m in logged_messages(mock_logger) if "Making request" in m]
+        self.assertEqual(len(request_lines), 251)
+
+    @patch("tap_adroll.request_log.LOGGER")
+    def test_periodic_summaries(self, mock_logger):
+        """Summaries cover the requests since the previous one, once per interval."""
+
+        clock = FakeClock(1000.0)
+        request_log = RequestLog(summary_interval=60, clock=clock)
+        for latency in range(1, 101):
+            request_log.record("report/ad", latency / 100.0, error=latency > 98)
+            clock.now += 0.5
+        clock.now = 1060.0
+        request_log.summarize()
+
+        summaries = [call[0] for call in mock_logger.info.call_args_list if call[0][0].startswith("Endpoint")]
+        self.assertEqual(len(summaries), 1)
+        endpoint, count, rate, p50, p95, errors = summaries[0][1:]
+        self.assertEqual((endpoint, count, errors), ("report/ad", 100, 2))
+        self.assertAlmostEqual(rate, 100 / 60.0)
+        self.assertEqual((p50, p95), (0.5, 0.95))
+
+        # Nothing since the last summary, so nothing to log at the end of the run
+        request_log.summarize(force=True)
+        self.assertEqual(mock_logger.info.call_count, 2)
@@ -0,0 +1,96 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+from requests.exceptions import ConnectionError, HTTPError, ReadTimeout
+
+from tap_adroll.client import AdrollClient
+from tap_adroll.retry import RetryPolicy
+
+from adroll_stand_in import CLIENT_CONFIG, StandInServer
+
+
+def http_error(status_code, headers=None):
+    response = MagicMock(status_code=status_code, headers=headers or {})
+    return HTTPError(response=response)
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    """Test the status-aware retry policy."""
+
+    def setUp(self):
+        self.sleeps = []
+        self.policy = RetryPolicy(max_tries=4, base_delay=1, max_delay=10, sleep=self.sleeps.append)
+
+    def test_non_retryable_status_fails_fast(self):
+        """A 401/403/404 is raised on the first attempt without sleeping."""
+
+        for status_code in (400, 401, 403, 404):
+            func = MagicMock(side_effect=http_error(status_code))
+            with self.assertRaises(HTTPError):
+                self.policy.call("organization/get", func)
+            self.assertEqual(func.call_count, 1)
+        self.assertEqual(self.sleeps, [])
+
+    def test_server_errors_back_off_exponentially(self):
+        """5xx responses are retried with full-jitter exponential delays."""
+
+        func = MagicMock(side_effect=http_error(503))
+        with patch("tap_adroll.retry.random.uniform", side_effect=lambda low, high: high):
+            with self.assertRaises(HTTPError):
+                self.policy.call("report/ad", func)
+
+        self.assertEqual(func.call_count, 4)
+        self.assertEqual(self.sleeps, [1, 2, 4])
+
+    def test_delay_is_capped(self):
+        """The computed delay never exceeds max_delay."""
+
+        with patch("tap_adroll.retry.random.uniform", side_effect=lambda low, high: high):
+            self.assertEqual(self.policy.delay(10, http_error(500)), 10)
+
+    def test_retry_after_is_honored(self):
+        """A 429 with Retry-After waits exactly that long before retrying."""
+
+        func = MagicMock(side_effect=[http_error(429, {"Retry-After": "3"}), "ok"])
+        self.assertEqual(self.policy.call("report/ad", func), "ok")
+        self.assertEqual(self.sleeps, [3.0])
+
+    def test_connection_errors_and_timeouts_are_retried(self):
+        """Connection errors and read timeouts are transient."""
+
+        func = MagicMock(side_effect=[ConnectionError(), ReadTimeout(), "ok"])
+        self.assertEqual(self.policy.call("advertisable/get_ads", func), "ok")
+        self.assertEqual(func.call_count, 3)
+
+    def test_other_exceptions_are_not_retried(self):
+        """Programming errors surface immediately."""
+
+        func = MagicMock(side_effect=ValueError())
+        with self.assertRaises(ValueError):
+            self.policy.call("advertisable/get_ads", func)
+        self.assertEqual(func.call_count, 1)
+
+    def test_stats_are_recorded(self):
+        """Attempts, retries and sleep time are counted per endpoint."""
+
+        func = MagicMock(side_effect=[http_error(429, {"Retry-After": "2"}), http_error(502, {"Retry-After": "1"}), "ok"])
+        self.policy.call("report/ad", func)
+        self.policy.call("advertisable/get_ads", MagicMock(return_value="ok"))
+
+        self.assertEqual(self.policy.stats["report/ad"], {"attempts": 3, "retries": 2, "sleep_seconds": 3.0})
+        self.assertEqual(self.policy.stats["advertisable/get_ads"], {"attempts": 1, "retries": 0, "sleep_seconds": 0.0})
+
+    def test_client_fails_fast_on_not_found(self):
+        """The client makes a single request for a 404 from the API."""
+
+        config = dict(CLIENT_CONFIG)
+        with StandInServer() as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url), patch("time.sleep") as mock_sleep:
+                client = AdrollClient("/dev/null", config, True)
+                with self.assertRaises(requests.exceptions.HTTPError):
+                    client.get("advertisable/get_missing")
+
+        self.assertEqual(len(stand_in.requests_to("advertisable/get_missing")), 1)
+        mock_sleep.assert_not_called()
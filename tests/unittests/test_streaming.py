@@ -0,0 +1,157 @@
+import gzip
+import json
+import time
+import tracemalloc
+import unittest
+from unittest.mock import Mock, patch
+
+from tap_adroll.client import AdrollClient
+from tap_adroll.streaming import iter_json_array
+
+from adroll_stand_in import CLIENT_CONFIG, StandInServer
+
+
+def report_payload(count):
+    return json.dumps({"message": "", "results": [
+        {"eid": "ad-{}".format(index), "impressions": index, "ctr": index / 3, "ad": "Ad \"{}\" ]}}".format(index)}
+        for index in range(count)
+    ]}).encode("utf-8")
+
+
+class TestIterJsonArray(unittest.TestCase):
+
+    """Test incrementally parsing the results array of a response body."""
+
+    def test_matches_full_parse_for_any_chunking(self):
+        """Items are the same as a full parse however the body is split."""
+
+        documents = [
+            {"message": "é \" ] }", "results": [{"a": [1, {"b": "]}"}], "c": "中😀"}, -1.5e10, True, None, "s,]", [], {}],
+             "after": {"x": [1]}},
+            {"results": []},
+            {"results": None},
+            {"message": "no results"},
+            {},
+        ]
+        for document in documents:
+            raw = json.dumps(document, ensure_ascii=False).encode("utf-8")
+            for size in (1, 2, 5, 1024):
+                chunks = [raw[i:i + size] for i in range(0, len(raw), size)]
+                self.assertEqual(list(iter_json_array(chunks)), document.get("results") or [])
+
+    def test_yields_before_body_is_read(self):
+        """The first record is yielded once its own bytes have arrived."""
+
+        raw = report_payload(1000)
+        read = []
+
+        def chunks():
+            for i in range(0, len(raw), 1024):
+                read.append(i)
+                yield raw[i:i + 1024]
+
+        first = next(iter_json_array(chunks()))
+        self.assertEqual(first["eid"], "ad-0")
+        self.assertEqual(len(read), 1)
+
+    def test_parsing_cost_is_close_to_a_full_decode(self):
+        """Items are decoded by the C scanner, so streaming costs little more CPU than one json.loads."""
+
+        raw = report_payload(50000)
+        chunks = [raw[i:i + 64 * 1024] for i in range(0, len(raw), 64 * 1024)]
+        start = time.process_time()
+        count = sum(1 for _ in iter_json_array(chunks))
+        streamed = time.process_time() - start
+        start = time.process_time()
+        json.loads(raw)
+        full = time.process_time() - start
+
+        print("{}KB report: {:.3f}s streamed, {:.3f}s decoded whole".format(len(raw) // 1024, streamed, full))
+        self.assertEqual(count, 50000)
+        self.assertLess(streamed, 4 * full)
+
+    def test_malformed_bodies_raise(self):
+        """Truncated or malformed bodies raise ValueError."""
+
+        for raw in (b'{"results": [1, 2', b'[1]', b'{"results": [1 2]}', b'{"results": [{"a": 1]}'):
+            with self.assertRaises(ValueError):
+                list(iter_json_array([raw]))
+
+
+class TestStreamingClient(unittest.TestCase):
+
+    """Test streaming results through the client against the stand-in."""
+
+    def setUp(self):
+        self.config = dict(CLIENT_CONFIG)
+        self.payload = report_payload(20000)
+        self.routes = {"report/ad": lambda params, headers: self.payload}
+
+    def test_streamed_records_match_and_reuse_connection(self):
+        """get_results yields the same records as get and leaves the connection reusable."""
+
+        with StandInServer(self.routes) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url):
+                client = AdrollClient("/dev/null", self.config, True)
+                expected = client.get("report/ad")["results"]
+                for _ in range(3):
+                    self.assertEqual(list(client.get_results("report/ad")), expected)
+                # Stopping early must not leak the connection either
+                next(client.get_results("report/ad"))
+                client.get("report/ad")
+            self.assertLessEqual(stand_in.connections, 2)
+
+    def test_small_bodies_are_decoded_whole(self):
+        """Bodies under stream_threshold_bytes go through the configured decoder in one call."""
+
+        with StandInServer(self.routes) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url), \
+                 patch("tap_adroll.client.get_decoder", return_value=Mock(wraps=json.loads)) as mock_decoder:
+                client = AdrollClient("/dev/null", {**self.config, "stream_threshold_bytes": len(self.payload)}, True)
+                whole = list(client.get_results("report/ad"))
+                self.assertEqual(mock_decoder.return_value.call_count, 1)
+
+                client = AdrollClient("/dev/null", {**self.config, "stream_threshold_bytes": len(self.payload) - 1},
+                                      True)
+                streamed = list(client.get_results("report/ad"))
+                self.assertEqual(mock_decoder.return_value.call_count, 1)
+
+        self.assertEqual(streamed, whole)
+        self.assertEqual(len(whole), 20000)
+
+    def test_compressed_bodies_are_streamed(self):
+        """A gzipped body is streamed even when its compressed size is under stream_threshold_bytes."""
+
+        compressed = gzip.compress(self.payload)
+        self.routes["report/ad"] = lambda params, headers: (200, {"Content-Encoding": "gzip"}, compressed)
+        with StandInServer(self.routes) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url), \
+                 patch("tap_adroll.client.get_decoder", return_value=Mock(wraps=json.loads)) as mock_decoder:
+                config = {**self.config, "stream_threshold_bytes": len(compressed) + 1}
+                records = list(AdrollClient("/dev/null", config, True).get_results("report/ad"))
+
+        self.assertLess(len(compressed), len(self.payload) // 4)
+        self.assertEqual(mock_decoder.return_value.call_count, 0)
+        self.assertEqual(len(records), 20000)
+
+    def test_streaming_keeps_memory_flat(self):
+        """Streaming a large report peaks far below materializing it."""
+
+        with StandInServer(self.routes) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url):
+                client = AdrollClient("/dev/null", self.config, True)
+
+                tracemalloc.start()
+                count = len(client.get("report/ad")["results"])
+                _, full_peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                tracemalloc.start()
+                streamed = sum(1 for _ in client.get_results("report/ad"))
+                _, streamed_peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+        print("{}KB report: peak {:.0f}KB materialized, {:.0f}KB streamed".format(
+            len(self.payload) // 1024, full_peak / 1024, streamed_peak / 1024))
+        self.assertEqual(streamed, count)
+        self.assertLess(streamed_peak, full_peak / 4)
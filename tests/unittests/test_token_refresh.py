@@ -0,0 +1,247 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from tap_adroll.client import AdrollAuthenticationError, AdrollClient, write_json_atomic
+
+from adroll_stand_in import StandInServer
+
+
+class TokenRoute:
+    """Issues a new token per refresh, slowly enough for refreshes to race."""
+
+    def __init__(self, delay=0.2, expires_in=3600):
+        self.delay = delay
+        self.expires_in = expires_in
+        self.refreshes = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, params, headers):
+        with self.lock:
+            self.refreshes += 1
+            number = self.refreshes
+        threading.Event().wait(self.delay)
+        return {
+            "access_token": "access-{}".format(number),
+            "refresh_token": "refresh-{}".format(number),
+            "token_type": "Bearer",
+            "expires_in": self.expires_in,
+        }
+
+
+def record_authorization(used_tokens):
+    def route(params, headers):
+        used_tokens.append(headers.get("Authorization"))
+        return {"results": {"eid": "ORG"}}
+    return route
+
+
+def run_client(config_path):
+    with open(config_path) as file:
+        config = json.load(file)
+    client = AdrollClient(config_path, config)
+    client.get("advertisable/get_ads")
+
+
+class TestTokenRefresh(unittest.TestCase):
+
+    """Test single-flight token refresh and atomic config writes."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.config_path = os.path.join(self.tmp_dir.name, "config.json")
+        self.config = {
+            "access_token": "access-0",
+            "refresh_token": "refresh-0",
+            "client_id": "sample_client_id",
+            "client_secret": "sample_client_secret",
+            "start_date": "2020-01-01T00:00:00Z",
+        }
+        with open(self.config_path, "w") as file:
+            json.dump(self.config, file)
+        self.token_route = TokenRoute()
+        self.used_tokens = []
+        self.routes = {
+            "auth/token": self.token_route,
+            "organization/get": record_authorization(self.used_tokens),
+            "advertisable/get_ads": record_authorization(self.used_tokens),
+        }
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def read_config(self):
+        with open(self.config_path) as file:
+            return json.load(file)
+
+    def test_rejected_refresh_token_asks_to_reauthenticate(self):
+        """A refresh token the API rejects raises AdrollAuthenticationError on the first request."""
+
+        self.routes["auth/token"] = lambda params, headers: (400, {}, {"error": "invalid_grant"})
+        with StandInServer(self.routes) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url), \
+                 patch("tap_adroll.client.TOKEN_REFRESH_URL", stand_in.token_url):
+                client = AdrollClient(self.config_path, dict(self.config))
+                with self.assertRaises(AdrollAuthenticationError):
+                    client.get("advertisable/get_ads")
+
+        self.assertEqual(len(stand_in.requests_to("auth/token")), 1)
+        self.assertEqual(self.used_tokens, [])
+
+    def test_threads_share_one_refresh(self):
+        """Threads that all find the token expired wait for a single refresh and reuse it."""
+
+        with StandInServer(self.routes) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url), \
+                 patch("tap_adroll.client.TOKEN_REFRESH_URL", stand_in.token_url):
+                client = AdrollClient(self.config_path, dict(self.config))
+
+                threads = [threading.Thread(target=client.get, args=("advertisable/get_ads",))
+                           for _ in range(8)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+        self.assertEqual(self.token_route.refreshes, 1)
+        self.assertEqual(self.used_tokens, ["Bearer access-1"] * 8)
+        self.assertEqual(self.read_config()["access_token"], "access-1")
+        self.assertEqual(self.read_config()["refresh_token"], "refresh-1")
+
+    def test_reuses_token_refreshed_by_another_client(self):
+        """A client whose token was already refreshed by another one adopts it from the config file."""
+
+        with StandInServer(self.routes) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url), \
+                 patch("tap_adroll.client.TOKEN_REFRESH_URL", stand_in.token_url):
+                first = AdrollClient(self.config_path, dict(self.config))
+                second = AdrollClient(self.config_path, dict(self.config))
+                self.assertEqual(first.organization_eid, "ORG")
+                self.assertEqual(second.organization_eid, "ORG")
+
+        # Only the first client refreshed, the second picked its token up from disk
+        self.assertEqual(self.token_route.refreshes, 1)
+        self.assertEqual(first.config["access_token"], "access-1")
+        self.assertEqual(second.config["access_token"], "access-1")
+        self.assertEqual(self.used_tokens, ["Bearer access-1", "Bearer access-1"])
+
+    def test_adopted_token_outlives_the_previous_expiry(self):
+        """A token adopted from another process is sent after the expiry of the one it replaced."""
+
+        self.token_route.expires_in = 62
+        clock = [time.time()]
+        with StandInServer(self.routes) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url), \
+                 patch("tap_adroll.client.TOKEN_REFRESH_URL", stand_in.token_url), \
+                 patch("time.time", lambda: clock[0]):
+                client = AdrollClient(self.config_path, dict(self.config))
+                client.get("advertisable/get_ads")
+
+                write_json_atomic(self.config_path, {**self.read_config(), "access_token": "access-other",
+                                                     "refresh_token": "refresh-other",
+                                                     "expires_at": clock[0] + 3600})
+                clock[0] += 10
+                client.get("advertisable/get_ads")
+                clock[0] += 100
+                client.get("advertisable/get_ads")
+
+        self.assertEqual(self.token_route.refreshes, 1)
+        self.assertEqual(self.used_tokens, ["Bearer access-1", "Bearer access-other", "Bearer access-other"])
+
+    def test_token_is_checked_after_waiting_for_a_slot(self):
+        """A token that expires while a request waits on the rate limiter is refreshed before sending."""
+
+        clock = [time.time()]
+        with StandInServer(self.routes) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url), \
+                 patch("tap_adroll.client.TOKEN_REFRESH_URL", stand_in.token_url), \
+                 patch("time.time", lambda: clock[0]):
+                client = AdrollClient(self.config_path, dict(self.config))
+                client.get("advertisable/get_ads")
+
+                def long_pause(endpoint):
+                    clock[0] += 3600
+
+                with patch.object(client.rate_limiter, "acquire", side_effect=long_pause):
+                    client.get("advertisable/get_ads")
+
+        self.assertEqual(self.token_route.refreshes, 2)
+        self.assertEqual(self.used_tokens, ["Bearer access-1", "Bearer access-2"])
+
+    def test_processes_share_one_refresh(self):
+        """Tap processes sharing a config file refresh once between them."""
+
+        context = multiprocessing.get_context("fork")
+        with StandInServer(self.routes) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url), \
+                 patch("tap_adroll.client.TOKEN_REFRESH_URL", stand_in.token_url):
+                processes = [context.Process(target=run_client, args=(self.config_path,)) for _ in range(4)]
+                for process in processes:
+                    process.start()
+                for process in processes:
+                    process.join()
+
+        self.assertEqual([process.exitcode for process in processes], [0, 0, 0, 0])
+        self.assertEqual(self.token_route.refreshes, 1)
+        self.assertEqual(set(self.used_tokens), {"Bearer access-1"})
+        self.assertEqual(self.read_config()["refresh_token"], "refresh-1")
+
+    def test_write_json_atomic_preserves_file_on_failure(self):
+        """A failed write leaves the previous config and no temporary files behind."""
+
+        with self.assertRaises(TypeError):
+            write_json_atomic(self.config_path, {"access_token": object()})
+
+        self.assertEqual(self.read_config(), self.config)
+        self.assertEqual(os.listdir(self.tmp_dir.name), ["config.json"])
+
+    def test_stored_expiry_skips_refresh_and_probe(self):
+        """A token with a stored expiry in the future is used as is, and start up makes no requests."""
+
+        config = {**self.config, "expires_at": time.time() + 3600}
+        with StandInServer(self.routes) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url), \
+                 patch("tap_adroll.client.TOKEN_REFRESH_URL", stand_in.token_url):
+                client = AdrollClient(self.config_path, config)
+                self.assertEqual(stand_in.requests, [])
+
+                client.get("advertisable/get_ads")
+                self.assertEqual(client.organization_eid, "ORG")
+                self.assertEqual(client.organization_eid, "ORG")
+
+            self.assertEqual(len(stand_in.requests_to("organization/get")), 1)
+        self.assertEqual(self.token_route.refreshes, 0)
+        self.assertEqual(self.used_tokens, ["Bearer access-0", "Bearer access-0"])
+
+    def test_expiry_is_stored_with_credentials(self):
+        """A refresh stores the new token's expiry next to it in the config file."""
+
+        with StandInServer(self.routes) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url), \
+                 patch("tap_adroll.client.TOKEN_REFRESH_URL", stand_in.token_url):
+                AdrollClient(self.config_path, dict(self.config)).get("advertisable/get_ads")
+
+        self.assertAlmostEqual(self.read_config()["expires_at"], time.time() + 3600, delta=60)
+
+    def test_unauthorized_token_is_refreshed_once(self):
+        """A 401 for a token believed to be valid refreshes it and retries the request."""
+
+        def get_ads(params, headers):
+            if headers.get("Authorization") == "Bearer access-0":
+                return 401, {}, {"message": "Unauthorized"}
+            return record_authorization(self.used_tokens)(params, headers)
+
+        self.routes["advertisable/get_ads"] = get_ads
+        config = {**self.config, "expires_at": time.time() + 3600}
+        with StandInServer(self.routes) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url), \
+                 patch("tap_adroll.client.TOKEN_REFRESH_URL", stand_in.token_url):
+                AdrollClient(self.config_path, config).get("advertisable/get_ads")
+
+        self.assertEqual(self.token_route.refreshes, 1)
+        self.assertEqual(self.used_tokens, ["Bearer access-1"])
@@ -0,0 +1,64 @@
+import gzip
+import json
+import unittest
+from unittest.mock import patch
+
+from tap_adroll.client import AdrollClient
+from tap_adroll.transfer import tap_version
+
+from adroll_stand_in import CLIENT_CONFIG, StandInServer
+
+REPORT = json.dumps({"results": [
+    {"eid": "ad-{}".format(index), "impressions": index, "clicks": 0, "cost": 0.0, "ad_size": "300x250"}
+    for index in range(2000)
+]}).encode("utf-8")
+
+
+def report_ad(params, headers):
+    if "gzip" in (headers.get("Accept-Encoding") or ""):
+        return 200, {"Content-Encoding": "gzip"}, gzip.compress(REPORT)
+    return 200, {}, REPORT
+
+
+class TestCompressedTransfer(unittest.TestCase):
+
+    """Test default headers negotiating compression and the accounting of transferred bytes."""
+
+    def setUp(self):
+        self.config = dict(CLIENT_CONFIG)
+        self.headers = []
+
+    def route(self, params, headers):
+        self.headers.append(headers)
+        return report_ad(params, headers)
+
+    def run_reports(self, config):
+        with StandInServer({"report/ad": self.route}) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url):
+                client = AdrollClient("/dev/null", config, True)
+                self.assertEqual(len(client.get("report/ad")["results"]), 2000)
+                self.assertEqual(len(list(client.get_results("report/ad"))), 2000)
+        return client.transfer_stats.stats["report/ad"]
+
+    def test_compressed_responses_are_accounted(self):
+        """Reports are negotiated as gzip and counted both as transferred and decompressed."""
+
+        stats = self.run_reports(self.config)
+
+        for headers in self.headers:
+            self.assertIn("gzip", headers["Accept-Encoding"])
+            self.assertEqual(headers["User-Agent"], "tap-adroll/{}".format(tap_version()))
+        print("report/ad: {wire_bytes} bytes transferred for {decoded_bytes} bytes".format(**stats))
+        self.assertEqual(stats["decoded_bytes"], 2 * len(REPORT))
+        self.assertEqual(stats["wire_bytes"], 2 * len(gzip.compress(REPORT)))
+        self.assertLess(stats["wire_bytes"], stats["decoded_bytes"] / 5)
+
+    def test_compression_can_be_disabled(self):
+        """With compression off, identity is requested and both counts are equal."""
+
+        stats = self.run_reports({**self.config, "compression": "false", "user_agent": "my-pipeline"})
+
+        for headers in self.headers:
+            self.assertEqual(headers["Accept-Encoding"], "identity")
+            self.assertEqual(headers["User-Agent"], "my-pipeline")
+        self.assertEqual(stats["wire_bytes"], stats["decoded_bytes"])
@@ -0,0 +1,77 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from tap_adroll.client import AdrollClient
+
+from adroll_stand_in import CLIENT_CONFIG, StandInServer
+
+
+def get_ads(params, headers):
+    return {"results": [{"eid": "ad-{}".format(params.get("advertisable"))}]}
+
+
+class TestPooledTransport(unittest.TestCase):
+
+    """Benchmark connection reuse of the client transport against a local stand-in."""
+
+    def setUp(self):
+        self.config = dict(CLIENT_CONFIG)
+
+    def run_requests(self, stand_in, config, count):
+        with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url):
+            client = AdrollClient("/dev/null", config, True)
+            start = time.monotonic()
+            for i in range(count):
+                client.get("advertisable/get_ads", params={"advertisable": i})
+            return time.monotonic() - start
+
+    def test_requests_reuse_one_connection(self):
+        """Sequential requests made through the session share a single kept-alive connection."""
+
+        with StandInServer({"advertisable/get_ads": get_ads}) as stand_in:
+            pooled = self.run_requests(stand_in, self.config, 50)
+            pooled_connections = stand_in.connections
+
+        with StandInServer({"advertisable/get_ads": get_ads}) as stand_in:
+            unpooled = self.run_requests(stand_in, {**self.config, "keep_alive": "false"}, 50)
+            unpooled_connections = stand_in.connections
+
+        print("pooled: {:.3f}s over {} connection(s); keep_alive=false: {:.3f}s over {} connection(s)".format(
+            pooled, pooled_connections, unpooled, unpooled_connections))
+        self.assertEqual(pooled_connections, 1)
+        self.assertEqual(unpooled_connections, 50)
+
+    def test_threads_share_bounded_pool(self):
+        """Worker threads sharing a client never open more connections than the pool allows."""
+
+        config = {**self.config, "pool_maxsize": 4, "pool_block": True}
+        with StandInServer({"advertisable/get_ads": get_ads}) as stand_in:
+            with patch("tap_adroll.client.ENDPOINT_BASE", stand_in.base_url):
+                client = AdrollClient("/dev/null", config, True)
+
+                def worker():
+                    for i in range(25):
+                        client.get("advertisable/get_ads", params={"advertisable": i})
+
+                threads = [threading.Thread(target=worker) for _ in range(8)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+            self.assertEqual(len(stand_in.requests_to("advertisable/get_ads")), 200)
+            self.assertLessEqual(stand_in.connections, 4)
+
+    def test_pool_fits_the_concurrency_settings(self):
+        """The pool holds a connection for every request the limiter and the async workers can have open."""
+
+        client = AdrollClient("/dev/null", {**self.config, "max_concurrency": 16}, True)
+        self.assertEqual(client.session.get_adapter("https://").poolmanager.connection_pool_kw["maxsize"], 26)
+
+        client = AdrollClient("/dev/null", {**self.config, "max_concurrency": 2, "async_concurrency": 4}, True)
+        self.assertEqual(client.session.get_adapter("https://").poolmanager.connection_pool_kw["maxsize"], 10)
+
+        client = AdrollClient("/dev/null", {**self.config, "pool_maxsize": 4}, True)
+        self.assertEqual(client.session.get_adapter("https://").poolmanager.connection_pool_kw["maxsize"], 4)